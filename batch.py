@@ -0,0 +1,98 @@
+#! /usr/bin/env python3
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import cubeio
+from cube import Cube, CubeData, TranspositionCache, compile_sequence
+
+_Solve_Cache = None
+
+
+def parse_line(line):
+    # a line is either six 9-square color strings (the Cube(configuration) format), one 54 character
+    # facelet string or a move sequence applied to a solved cube; returns the sticker state
+    parts = line.replace(',', ' ').split()
+    if len(parts) == 1 and len(parts[0]) == 54:
+        return cubeio.facelets_to_state(parts[0])
+    if len(parts) == 6 and all(len(face) == 9 and all(square in CubeData.Colors for square in face) for face in parts):
+        return CubeData.decode_configuration(parts)
+    state = bytearray(CubeData.Solved_State)
+    CubeData.apply_permutation(state, compile_sequence(parts).permutation)
+    return bytes(state)
+
+
+def format_state(state):
+    return ' '.join(Cube.from_state(state).to_configuration())
+
+
+def _scramble_line(line, facelets=False):
+    state = parse_line(line)
+    return cubeio.state_to_facelets(state) if facelets else format_state(state)
+
+
+def _solve_line(line, max_length, timeout, cache_size=0):
+    # each process keeps its own transposition cache, so symmetric duplicates in its chunks are solved once
+    global _Solve_Cache
+    import solver
+    if cache_size and (_Solve_Cache is None or _Solve_Cache.maxsize != cache_size):
+        _Solve_Cache = TranspositionCache(cache_size)
+    moves = solver.solve(Cube.from_state(parse_line(line)), max_length=max_length, timeout=timeout,
+                         cache=_Solve_Cache if cache_size else None)
+    return 'NONE' if moves is None else ' '.join(moves)
+
+
+def _run_chunk(function, lines, *args):
+    results = []
+    for line in lines:
+        try:
+            results.append(function(line, *args))
+        except ValueError as error:
+            results.append(f'ERROR {error}')
+    return results
+
+
+def _init_worker():
+    # map the shared table file once per worker instead of once per chunk
+    import solver
+    solver.SolverTables.get()
+
+
+def _chunks(lines, chunksize):
+    lines = (line.strip() for line in lines)
+    lines = (line for line in lines if line and not line.startswith('#'))
+    while True:
+        chunk = list(islice(lines, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run_batch(function, lines, args=(), workers=None, chunksize=64, initializer=None):
+    # results are yielded in input order; at most 2 chunks per worker are in flight, so memory stays
+    # bounded however long the input is
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    if workers <= 1:
+        if initializer is not None:
+            initializer()
+        for chunk in _chunks(lines, chunksize):
+            yield from _run_chunk(function, chunk, *args)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer) as executor:
+        pending = deque()
+        for chunk in _chunks(lines, chunksize):
+            pending.append(executor.submit(_run_chunk, function, chunk, *args))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def scramble_batch(lines, workers=None, chunksize=256, facelets=False):
+    return run_batch(_scramble_line, lines, (facelets,), workers=workers, chunksize=chunksize)
+
+
+def solve_batch(lines, workers=None, chunksize=16, max_length=21, timeout=10.0, cache_size=0):
+    return run_batch(_solve_line, lines, (max_length, timeout, cache_size), workers=workers, chunksize=chunksize, initializer=_init_worker)
@@ -0,0 +1,231 @@
+#! /usr/bin/env python3
+
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+
+import solver
+from cube import Cube, CubeData, Sequence_Compiler, compile_sequence, import_numpy
+from scramble import ScrambleGenerator
+
+# every token accepted by CubeData.Turn_Pattern, in its normalized spelling
+Tokens = [f'{prefix}{turn}{suffix}' for turn in CubeData.Turns for prefix in ['', '2', '3'] for suffix in ['', 'i']]
+
+
+def _per_call(function, repeat=3, min_time=0.05):
+    # best of repeat runs, in seconds per call; the loop count is grown until one run takes min_time
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    return min([elapsed] + timer.repeat(repeat=repeat - 1, number=number)) / number
+
+
+def _rate(seconds, count=1):
+    return round(count / seconds, 1)
+
+
+def _scrambled(rng, length=30):
+    cube = Cube()
+    cube.rotate_sequence(rng.choices(Tokens, k=length))
+    return cube
+
+
+def bench_moves(repeat, min_time):
+    # single rotate() calls per second, per token
+    cube = Cube()
+    return {token: _rate(_per_call(lambda: cube.rotate(token), repeat, min_time)) for token in Tokens}
+
+
+def bench_sequences(rng, repeat, min_time, length=1000):
+    moves = rng.choices(Tokens, k=length)
+    cube = Cube()
+
+    def rotate_each():
+        for move in moves:
+            cube.rotate(move)
+
+    def compile_uncached():
+        Sequence_Compiler.clear()
+        compile_sequence(moves)
+
+    results = {
+        'length': length,
+        'rotate_moves_per_sec': _rate(_per_call(rotate_each, repeat, min_time), length),
+        'compile_moves_per_sec': _rate(_per_call(compile_uncached, repeat, min_time), length),
+    }
+    lazy = Cube()
+    lazy.enable_lazy()
+
+    def rotate_lazy():
+        for move in moves:
+            lazy.rotate(move)
+        lazy.flush()
+
+    results['lazy_rotate_moves_per_sec'] = _rate(_per_call(rotate_lazy, repeat, min_time), length)
+    # share of the turns that cancelled or merged before reaching the state
+    lazy = Cube()
+    lazy.enable_lazy()
+    rotate_lazy()
+    results['lazy_elided_fraction'] = round(lazy.elided_moves / length, 3)
+    compile_sequence(moves)
+    results['rotate_sequence_cached_moves_per_sec'] = _rate(_per_call(lambda: cube.rotate_sequence(moves), repeat, min_time), length)
+    return results
+
+
+def bench_construction(rng, repeat, min_time):
+    configuration = _scrambled(rng).to_configuration()
+    invalid = list(configuration)
+    invalid[0] = invalid[0][1:] + invalid[0][0]
+    cube = Cube()
+    return {
+        'solved_per_sec': _rate(_per_call(Cube, repeat, min_time)),
+        'configuration_per_sec': _rate(_per_call(lambda: Cube(configuration), repeat, min_time)),
+        'validate_per_sec': _rate(_per_call(lambda: cube.is_valid_configuration(configuration), repeat, min_time)),
+        'validate_invalid_per_sec': _rate(_per_call(lambda: cube.is_valid_configuration(invalid), repeat, min_time)),
+        'to_configuration_per_sec': _rate(_per_call(cube.to_configuration, repeat, min_time)),
+    }
+
+
+def bench_is_solved(rng, repeat, min_time):
+    solved, scrambled = Cube(), _scrambled(rng)
+    return {
+        'solved_per_sec': _rate(_per_call(solved.is_solved, repeat, min_time)),
+        'scrambled_per_sec': _rate(_per_call(scrambled.is_solved, repeat, min_time)),
+        'face_per_sec': _rate(_per_call(scrambled.configuration['F'].is_solved, repeat, min_time)),
+    }
+
+
+def bench_render(rng, repeat, min_time):
+    cube = _scrambled(rng)
+    return {
+        'str_per_sec': _rate(_per_call(lambda: str(cube), repeat, min_time)),
+        'repr_per_sec': _rate(_per_call(lambda: repr(cube), repeat, min_time)),
+    }
+
+
+def bench_canonical(rng, repeat, min_time):
+    cube = _scrambled(rng)
+    return {'canonical_per_sec': _rate(_per_call(cube.canonical, repeat, min_time))}
+
+
+def bench_scramble(repeat, min_time, batch=65536):
+    # uniformly random states, one at a time and (with numpy) a batch at a time
+    generator = ScrambleGenerator(0)
+    results = {'states_per_sec': _rate(_per_call(generator.state, repeat, min_time))}
+    if import_numpy() is not None:
+        generator.states(1)
+        results['batch_states_per_sec'] = _rate(_per_call(lambda: generator.states(batch), repeat, min_time), batch)
+    return results
+
+
+def bench_solve(seed, count=20, max_length=21, timeout=10.0):
+    # the same seeded random states every run, solved (and replayed) with the tables already built and loaded
+    tables = solver.SolverTables.get()
+    for name in solver.SolverTables.Table_Names:
+        getattr(tables, name)
+    generator = ScrambleGenerator(seed)
+    results = solver.check_solutions([generator.state() for _ in range(count)], max_length, timeout)
+    seconds = sorted(seconds for moves, seconds in results)
+    lengths = [len(moves) for moves, seconds in results if moves is not None]
+    return {
+        'states': count,
+        'solved': len(lengths),
+        'mean_length': round(sum(lengths) / len(lengths), 2) if lengths else None,
+        'longest': max(lengths, default=None),
+        'p50_seconds': round(seconds[len(seconds) // 2], 4),
+        'p90_seconds': round(seconds[min(len(seconds) - 1, len(seconds) * 9 // 10)], 4),
+    }
+
+
+def bench_memory(count=1000):
+    # peak traced allocation for count live cubes, per cube
+    Cube()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        cubes = [Cube() for _ in range(count)]
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del cubes
+    return {'cubes': count, 'peak_bytes_per_cube': round(peak / count, 1)}
+
+
+def _commit():
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return output.stdout.strip() or None
+
+
+def run(repeat=3, min_time=0.05, seed=0):
+    rng = random.Random(seed)
+    return {
+        'meta': {
+            'commit': _commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'min_time': min_time,
+            'seed': seed,
+        },
+        'moves_per_sec': bench_moves(repeat, min_time),
+        'sequence': bench_sequences(rng, repeat, min_time),
+        'construction': bench_construction(rng, repeat, min_time),
+        'is_solved': bench_is_solved(rng, repeat, min_time),
+        'render': bench_render(rng, repeat, min_time),
+        'symmetry': bench_canonical(rng, repeat, min_time),
+        'scramble': bench_scramble(repeat, min_time),
+        'solve': bench_solve(seed),
+        'memory': bench_memory(),
+    }
+
+
+def _flatten(results, prefix=''):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f'{prefix}{key}.')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f'{prefix}{key}', value
+
+
+def compare(baseline, results):
+    # new / old for every numeric result both runs have; for rates higher is better, for memory and seconds lower is
+    baseline = dict(_flatten({key: value for key, value in baseline.items() if key != 'meta'}))
+    return {key: round(value / baseline[key], 3) for key, value in _flatten({key: value for key, value in results.items() if key != 'meta'})
+            if baseline.get(key)}
+
+
+def main(output='-', baseline=None, repeat=3, min_time=0.05, seed=0):
+    results = run(repeat=repeat, min_time=min_time, seed=seed)
+    if baseline is not None:
+        with open(baseline) as handle:
+            baseline = json.load(handle)
+        results['compare'] = {'baseline': baseline.get('meta', {}).get('commit'), 'ratio': compare(baseline, results)}
+    text = json.dumps(results, indent=2)
+    if output == '-':
+        print(text)
+    else:
+        with open(output, 'w') as handle:
+            handle.write(text + '\n')
+    return results
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
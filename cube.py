@@ -1,14 +1,38 @@
 #! /usr/bin/env python3
 
-import datetime
+import argparse
+import array
+import functools
+import itertools
+import operator
+import logging
 import random
 import re
+import sys
+import time
+from collections import OrderedDict, deque
+
+np = None
+# per move trace, e.g. logging.getLogger('cube').setLevel(logging.DEBUG)
+logger = logging.getLogger('cube')
+
+
+def import_numpy():
+    # numpy is optional and slow to import, so it is only loaded by the code paths that use it
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return None
+        np = numpy
+    return np
 
 class CubeData:
     # Faces / Colors / Turns
     Faces = ['R', 'L', 'U', 'D', 'F', 'B']
     Colors = ['R', 'O', 'Y', 'W', 'B', 'G']
-    Turns = ['R', 'L', 'U', 'D', 'F', 'B', 'r', 'l', 'u', 'd', 'f', 'b', 'M', 'E', 'S']
+    Turns = ['R', 'L', 'U', 'D', 'F', 'B', 'r', 'l', 'u', 'd', 'f', 'b', 'M', 'E', 'S', 'x', 'y', 'z']
     Face_Color_Map = {
         'R': 'R',
         'L': 'O',
@@ -32,53 +56,16 @@ class CubeData:
         'G': 'Green'}
 
     # Regex Compilations
-    Turn_Pattern = re.compile('^([1-3])*([RLUDFBrludfbMES]{1})(i)*$')
+    Turn_Pattern = re.compile('^([1-3])*([RLUDFBrludfbMESxyz]{1})(i)*$')
+    # kept for callers of the 3x3 API; cubes of any size index squares with CubeGeometry.Square_Pattern
     Square_Pattern = re.compile('^([RLUDFBrludfb]{1})([1-9]{1})$')
 
-    # Turn Data
-    Turn_Map = {
-        'R': {'U': ['F', {3: 3, 6: 6, 9: 9}], 
-              'D': ['B', {3: 7, 6: 4, 9: 1}],
-              'F': ['D', {3: 3, 6: 6, 9: 9}], 
-              'B': ['U', {1: 9, 4: 6, 7: 3}], 
-              'R': ['R', {1: 7, 2: 4, 3: 1, 4: 8, 5: 5, 6: 2, 7: 9, 8: 6, 9: 3}]},
-        'L': {'U': ['B', {1: 9, 4: 6, 7: 3}],
-              'D': ['F', {1: 1, 4: 4, 7: 7}],
-              'F': ['U', {1: 1, 4: 4, 7: 7}],
-              'B': ['D', {3: 7, 6: 4, 9: 1}],
-              'L': ['L', {1: 7, 2: 4, 3: 1, 4: 8, 5: 5, 6: 2, 7: 9, 8: 6, 9: 3}]},
-        'U': {'R': ['B', {1: 1, 2: 2, 3: 3}],
-              'L': ['F', {1: 1, 2: 2, 3: 3}],
-              'F': ['R', {1: 1, 2: 2, 3: 3}],
-              'B': ['L', {1: 1, 2: 2, 3: 3}],
-              'U': ['U', {1: 7, 2: 4, 3: 1, 4: 8, 5: 5, 6: 2, 7: 9, 8: 6, 9: 3}]},
-        'D': {'R': ['F', {7: 7, 8: 8, 9: 9}],
-              'L': ['B', {7: 7, 8: 8, 9: 9}],
-              'F': ['L', {7: 7, 8: 8, 9: 9}],
-              'B': ['R', {7: 7, 8: 8, 9: 9}],
-              'D': ['D', {1: 7, 2: 4, 3: 1, 4: 8, 5: 5, 6: 2, 7: 9, 8: 6, 9: 3}]},
-        'F': {'R': ['U', {1: 7, 4: 8, 7: 9}],
-              'L': ['D', {3: 1, 6: 2, 9: 3}],
-              'U': ['L', {7: 9, 8: 6, 9: 3}],
-              'D': ['R', {1: 7, 2: 4, 3: 1}],
-              'F': ['F', {1: 7, 2: 4, 3: 1, 4: 8, 5: 5, 6: 2, 7: 9, 8: 6, 9: 3}]},
-        'B': {'R': ['D', {3: 9, 6: 8, 9: 7}],
-              'L': ['U', {1: 3, 4: 2, 7: 1}],
-              'U': ['R', {1: 3, 2: 6, 3: 9}],
-              'D': ['L', {7: 1, 8: 4, 9: 7}],
-              'B': ['B', {1: 7, 2: 4, 3: 1, 4: 8, 5: 5, 6: 2, 7: 9, 8: 6, 9: 3}]},
-        'M': {'U': ['B', {2: 8, 5: 5, 8: 2}],
-              'D': ['F', {2: 2, 5: 5, 8: 8}],
-              'F': ['U', {2: 2, 5: 5, 8: 8}],
-              'B': ['D', {2: 8, 5: 5, 8: 2}]},
-        'E': {'R': ['F', {4: 4, 5: 5, 6: 6}],
-              'L': ['B', {4: 4, 5: 5, 6: 6}],
-              'F': ['L', {4: 4, 5: 5, 6: 6}],
-              'B': ['R', {4: 4, 5: 5, 6: 6}]},
-        'S': {'R': ['U', {2: 4, 5: 5, 8: 6}],
-              'L': ['D', {2: 4, 5: 5, 8: 6}],
-              'U': ['L', {4: 8, 5: 5, 6: 2}],
-              'D': ['R', {4: 8, 5: 5, 6: 2}]}}
+    # turns sharing an axis commute with each other
+    Turn_Axis = {
+        'R': 'x', 'L': 'x', 'M': 'x', 'r': 'x', 'l': 'x',
+        'U': 'y', 'D': 'y', 'E': 'y', 'u': 'y', 'd': 'y',
+        'F': 'z', 'B': 'z', 'S': 'z', 'f': 'z', 'b': 'z',
+        'x': 'x', 'y': 'y', 'z': 'z'}
 
     # Location / Orientation Reference
     Square_Reference = {
@@ -124,8 +111,8 @@ class CubeData:
         'O': {'Y': ['L2', 'U4'], 'W': ['L8', 'D4'], 'B': ['L6', 'F4'], 'G': ['L4', 'B6']},
         'Y': {'R': ['U6', 'R2'], 'O': ['U4', 'L2'], 'B': ['U8', 'F2'], 'G': ['U2', 'B2']},
         'W': {'R': ['D6', 'R8'], 'O': ['D4', 'L8'], 'B': ['D2', 'F8'], 'G': ['D8', 'B8']},
-        'G': {'R': ['F6', 'R4'], 'O': ['F4', 'L6'], 'Y': ['F2', 'U8'], 'W': ['F8', 'D2']},
-        'B': {'R': ['B4', 'R6'], 'O': ['B6', 'L4'], 'Y': ['B2', 'U2'], 'W': ['B8', 'D8']}}
+        'B': {'R': ['F6', 'R4'], 'O': ['F4', 'L6'], 'Y': ['F2', 'U8'], 'W': ['F8', 'D2']},
+        'G': {'R': ['B4', 'R6'], 'O': ['B6', 'L4'], 'Y': ['B2', 'U2'], 'W': ['B8', 'D8']}}
     Flat_Color_Map = {
         'R': 'R5',
         'O': 'L5',
@@ -156,18 +143,660 @@ class CubeData:
         'LDF': ['OWB', 'OBW', 'WOB', 'WBO', 'BOW', 'BWO'],
         'LDB': ['OWG', 'OGW', 'WOG', 'WGO', 'GOW', 'GWO']}
 
+    # Piece Squares (slot order; U/D square first, F/B for the middle layer edges, then clockwise)
+    Corner_Squares = [
+        ['U9', 'R1', 'F3'], ['U7', 'F1', 'L3'], ['U1', 'L1', 'B3'], ['U3', 'B1', 'R3'],
+        ['D3', 'F9', 'R7'], ['D1', 'L9', 'F7'], ['D7', 'B9', 'L7'], ['D9', 'R9', 'B7']]
+    Edge_Squares = [
+        ['U6', 'R2'], ['U8', 'F2'], ['U4', 'L2'], ['U2', 'B2'], ['D6', 'R8'], ['D2', 'F8'],
+        ['D4', 'L8'], ['D8', 'B8'], ['F6', 'R4'], ['F4', 'L6'], ['B6', 'L4'], ['B4', 'R6']]
+    Center_Squares = ['R5', 'L5', 'U5', 'D5', 'F5', 'B5']
+
+    # Sticker Indexing (flat state: 9 stickers per face, faces in CubeData.Faces order)
+    Sticker_Labels = [f'{face}{square}' for face in Faces for square in range(1, 10)]
+    Sticker_Index = dict((label, index) for index, label in enumerate(Sticker_Labels))
+    Solved_State = bytes(range(54))
+    Solved_Value = int.from_bytes(Solved_State, 'little')
+    Turn_Permutations = {}
+    Turn_Changes = {}
+    Moved_Squares = {}
+    All_Moved = (1 << 54) - 1
+
     @staticmethod
     def rotation_keys(turn_data, face, key, rotations=1):
+        # (face, square) a square of a hand-written turn table ({face: [next face, {square: next square}]}) ends
+        # on after rotations quarter turns; the turns themselves now come from CubeGeometry
         if rotations == 1:
             return turn_data[face][0], turn_data[face][1][key]
         else:
             return CubeData.rotation_keys(turn_data, turn_data[face][0], turn_data[face][1][key], rotations - 1)
 
+    @staticmethod
+    def turn_permutation(rotation):
+        # compile a turn into a 54 entry gather permutation (new_state[i] = old_state[perm[i]])
+        perm = CubeData.Turn_Permutations.get(rotation)
+        if perm is not None:
+            return perm
+        match = CubeData.Turn_Pattern.match(rotation)
+        if match is None:
+            return None
+        pattern = match.groups()
+        rotations = 1 if pattern[0] is None else int(pattern[0])
+        direction = pattern[1]
+        inverted = True if pattern[2] is not None else False
+        token = f'{"" if rotations == 1 else rotations}{direction}{"i" if inverted else ""}'
+        if token in CubeData.Turn_Permutations:
+            return CubeData.Turn_Permutations[token]
+
+        # the turns themselves are generated from the cube's geometry, of which the 3x3 is the n = 3 case
+        perm = CubeGeometry.get(3).turn_permutation(token)
+        CubeData.Turn_Permutations[token] = perm
+        return perm
+
+    @staticmethod
+    def turn_changes(perm):
+        # (bitmask of the faces, bitmask of the squares) whose stickers a turn moves; SolvedCounts only recounts
+        # those faces and the Zobrist hash only rehashes those squares
+        changes = CubeData.Turn_Changes.get(perm)
+        if changes is None:
+            moved = [i for i in range(54) if perm[i] != i]
+            changes = CubeData.Turn_Changes[perm] = (sum(1 << face for face in set(i // 9 for i in moved)), sum(1 << i for i in moved))
+        return changes
+
+    @staticmethod
+    def moved_squares(mask):
+        # Zobrist squares of a square bitmask, cached: the turns between two hashes merge their masks, and a few
+        # masks (one turn, two turns, every square) cover most calls
+        squares = CubeData.Moved_Squares.get(mask)
+        if squares is None:
+            if len(CubeData.Moved_Squares) >= 4096:
+                CubeData.Moved_Squares.clear()
+            squares = CubeData.Moved_Squares[mask] = CubeData.zobrist_squares([i for i in range(54) if mask >> i & 1])
+        return squares
+
+    @staticmethod
+    def zobrist_squares(squares):
+        # (sticker getter, key rows) for a set of squares, so hashing them is a few C level calls
+        return operator.itemgetter(*squares), tuple(CubeData.Zobrist_Keys[i] for i in squares)
+
+    @staticmethod
+    def zobrist(state, squares=None):
+        # xor of the keys of the stickers on squares (default: every square)
+        getter, rows = CubeData.All_Squares if squares is None else squares
+        return functools.reduce(operator.xor, map(operator.getitem, rows, getter(state)), 0)
+
+    @staticmethod
+    def parity(perm):
+        # parity of a permutation of range(n): (n - cycles) % 2
+        seen = [False] * len(perm)
+        cycles = 0
+        for start in range(len(perm)):
+            if not seen[start]:
+                cycles += 1
+                position = start
+                while not seen[position]:
+                    seen[position] = True
+                    position = perm[position]
+        return (len(perm) - cycles) % 2
+
+    @staticmethod
+    def decode_configuration(configuration):
+        # one pass over the 6 centers, 8 corners and 12 edges; returns the sticker state or raises ValueError
+        # if the colors are not a cube that can be solved
+        if isinstance(configuration, (list, tuple)) and len(configuration) == 6 and all(isinstance(face, str) and len(face) == 9 for face in configuration):
+            colors = ''.join(configuration)
+        elif isinstance(configuration, str) and len(configuration) == 54:
+            colors = configuration
+        else:
+            raise ValueError('configuration must be 6 faces of 9 squares')
+        state = bytearray(54)
+        center = CubeData.Center_Lookup.get(''.join([colors[i] for i in CubeData.Center_Stickers]))
+        if center is None:
+            raise ValueError('invalid center colors')
+        centers, center_parity = center
+        for i, sticker in zip(CubeData.Center_Stickers, centers):
+            state[i] = sticker
+
+        corner_lookup, corner_orientations = CubeData.Corner_Lookup, CubeData.Corner_Orientations
+        corners, twist = [], 0
+        for a, b, c in CubeData.Corner_Stickers:
+            corner = corner_lookup.get(colors[a] + colors[b] + colors[c])
+            if corner is None:
+                raise ValueError(f'invalid corner colors {colors[a] + colors[b] + colors[c]}')
+            piece, orientation = corner
+            corners.append(piece)
+            twist += orientation
+            state[a], state[b], state[c] = corner_orientations[piece][orientation]
+
+        edge_lookup, edge_orientations = CubeData.Edge_Lookup, CubeData.Edge_Orientations
+        edges, flip = [], 0
+        for a, b in CubeData.Edge_Stickers:
+            edge = edge_lookup.get(colors[a] + colors[b])
+            if edge is None:
+                raise ValueError(f'invalid edge colors {colors[a] + colors[b]}')
+            piece, orientation = edge
+            edges.append(piece)
+            flip += orientation
+            state[a], state[b] = edge_orientations[piece][orientation]
+
+        if len(set(corners)) != 8:
+            raise ValueError('duplicate corner')
+        if len(set(edges)) != 12:
+            raise ValueError('duplicate edge')
+        if twist % 3 != 0:
+            raise ValueError('twisted corner')
+        if flip % 2 != 0:
+            raise ValueError('flipped edge')
+        if CubeData.parity(corners) ^ CubeData.parity(edges) != center_parity:
+            raise ValueError('permutation parity')
+        return bytes(state)
+
+    @staticmethod
+    def apply_permutation(state, perm):
+        # gather in place; bytes.translate does the whole lookup in one C call (table padded to 256)
+        state[:] = perm.translate(state + CubeData.Translate_Padding)
+
+    @staticmethod
+    def symmetries():
+        # the 48 whole cube symmetries as (gather, relabel) sticker permutations, identity first: image =
+        # relabel(gather(state)), i.e. the same position seen through the symmetry, still with every sticker id
+        # naming its home square; a sticker is located by (sum of its piece's face normals, its own face normal),
+        # each signed axis permutation maps that to another sticker, and determinant 1 ones are rotations
+        if not hasattr(CubeData, '_Symmetries'):
+            sticker_at = {}
+            for squares in CubeData.Corner_Squares + CubeData.Edge_Squares + [[square] for square in CubeData.Center_Squares]:
+                position = tuple(sum(CubeData.Face_Normals[square[0]][axis] for square in squares) for axis in range(3))
+                for square in squares:
+                    sticker_at[(position, CubeData.Face_Normals[square[0]])] = CubeData.Sticker_Index[square]
+            symmetries = []
+            for axes in itertools.permutations(range(3)):
+                for signs in itertools.product([1, -1], repeat=3):
+                    moved = bytearray(54)
+                    for (position, normal), sticker in sticker_at.items():
+                        moved[sticker] = sticker_at[(tuple(signs[k] * position[axes[k]] for k in range(3)), tuple(signs[k] * normal[axes[k]] for k in range(3)))]
+                    gather = bytearray(54)
+                    for sticker, target in enumerate(moved):
+                        gather[target] = sticker
+                    symmetries.append((bytes(gather), bytes(moved) + CubeData.Translate_Padding))
+            CubeData._Symmetries = symmetries
+        return CubeData._Symmetries
+
+    @staticmethod
+    def symmetry_moves():
+        # symmetry index -> token -> the token doing the same turn in the unrelabelled position (R -> Li for a mirror)
+        if not hasattr(CubeData, '_Symmetry_Moves'):
+            turns = dict((token, CubeData.Turn_Permutations[token]) for token in CubeData.Turn_Quarters)
+            token_of = {}
+            for token, perm in turns.items():
+                token_of.setdefault(perm, token)
+            CubeData._Symmetry_Moves = [dict((token, token_of[bytes(gather[perm[relabel[i]]] for i in range(54))]) for token, perm in turns.items())
+                                        for gather, relabel in CubeData.symmetries()]
+        return CubeData._Symmetry_Moves
+
+    @staticmethod
+    def orientation_fix():
+        # center stickers -> (whole cube rotation tokens, their permutation) that bring the centers home
+        if not hasattr(CubeData, '_Orientation_Fix'):
+            fixes = {CubeData.Center_Gather: ((), CubeData.Solved_State)}
+            pending = [((), CubeData.Solved_State)]
+            for tokens, perm in pending:
+                for token in ['x', 'y', 'z', '2x', '2y', '2z', 'xi', 'yi', 'zi']:
+                    state = bytearray(perm)
+                    CubeData.apply_permutation(state, CubeData.Turn_Permutations[token])
+                    centers = CubeData.Center_Gather.translate(state + CubeData.Translate_Padding)
+                    if centers not in fixes:
+                        pending.append((tokens + (token,), bytes(state)))
+                        # undoing the tokens: reversed and inverted
+                        undo = tuple(turn[:-1] if turn.endswith('i') else (turn if turn[0] == '2' else f'{turn}i') for turn in reversed(tokens + (token,)))
+                        fix = bytearray(CubeData.Solved_State)
+                        for turn in undo:
+                            CubeData.apply_permutation(fix, CubeData.Turn_Permutations[turn])
+                        fixes[centers] = (undo, bytes(fix))
+            CubeData._Orientation_Fix = fixes
+        return CubeData._Orientation_Fix
+
+
+class CubeGeometry:
+    # sticker layout and turns of an n x n x n cube, faces in CubeData.Faces order with n * n squares each,
+    # numbered 1 .. n * n row by row; every turn is generated from the stickers' doubled coordinates (position,
+    # face normal), so all sizes share one notation and one permutation kernel, and the 3x3 is the n = 3 case
+    # face -> (normal, right, down) looking at the face
+    Face_Frames = {
+        'R': ((1, 0, 0), (0, 0, -1), (0, -1, 0)),
+        'L': ((-1, 0, 0), (0, 0, 1), (0, -1, 0)),
+        'U': ((0, 1, 0), (1, 0, 0), (0, 0, 1)),
+        'D': ((0, -1, 0), (1, 0, 0), (0, 0, -1)),
+        'F': ((0, 0, 1), (1, 0, 0), (0, -1, 0)),
+        'B': ((0, 0, -1), (-1, 0, 0), (0, -1, 0))}
+    # the 3x3 tokens plus a layer range on a face turn: R.2 turns the second layer from R alone, R.1-3 the three
+    # outer R layers; r is R.1-2, M / E / S every inner layer (following L / D / F) and x / y / z the whole cube
+    Turn_Pattern = re.compile('^([1-3])?([RLUDFBrludfbMESxyz]{1})(?:\\.([0-9]+)(?:-([0-9]+))?)?(i)?$')
+    Square_Pattern = re.compile('^([RLUDFBrludfb]{1})([0-9]+)$')
+    Instances = {}
+
+    def __init__(self, n):
+        if n < 2:
+            raise ValueError(f'Invalid cube size: {n}')
+        self.n = n
+        self.area = n * n
+        self.size = 6 * self.area
+        self.labels = [f'{face}{square}' for face in CubeData.Faces for square in range(1, self.area + 1)]
+        self.index = dict((label, index) for index, label in enumerate(self.labels))
+        self.colors = ''.join(CubeData.Face_Color_Map[label[0]] for label in self.labels)
+        self.color_table = self.colors.encode().ljust(256, b'?')
+        # up to 256 stickers (n <= 6) a state is a bytearray and a turn a bytes.translate table, past that a
+        # state is an array of shorts and a turn a numpy index array taken over it (an itemgetter without numpy)
+        self.narrow = self.size <= 256
+        self.numpy = None if self.narrow else import_numpy()
+        self.padding = bytes(256 - self.size) if self.narrow else None
+        self.solved = bytes(range(self.size)) if self.narrow else array.array('H', range(self.size))
+        self.squares = {}
+        for number, face in enumerate(CubeData.Faces):
+            normal, right, down = self.Face_Frames[face]
+            for row in range(n):
+                for column in range(n):
+                    position = tuple(normal[k] * n + right[k] * (2 * column - n + 1) + down[k] * (2 * row - n + 1) for k in range(3))
+                    self.squares[(position, normal)] = number * self.area + row * n + column
+        self.permutations = {}
+        self.quarters = {}
+        self.face_turns = {}
+
+    @classmethod
+    def get(cls, n):
+        geometry = cls.Instances.get(n)
+        if geometry is None:
+            geometry = cls.Instances[n] = cls(n)
+        return geometry
+
+    def new_state(self):
+        return bytearray(self.solved) if self.narrow else array.array('H', self.solved)
+
+    def apply_permutation(self, state, perm):
+        # gather in place (new_state[i] = old_state[perm[i]])
+        if self.narrow:
+            state[:] = perm.translate(state + self.padding)
+        elif self.numpy is not None:
+            shorts = self.numpy.frombuffer(state, dtype=self.numpy.uint16)
+            shorts[:] = shorts.take(perm)
+        else:
+            state[:] = array.array('H', perm(state))
+
+    def permutation(self, gathered):
+        # a permutation in the kernel's form from the state it turns the solved state into
+        if self.narrow:
+            return bytes(gathered)
+        if self.numpy is not None:
+            return self.numpy.array(gathered, dtype=self.numpy.intp)
+        return operator.itemgetter(*gathered)
+
+    def compose(self, perms):
+        # the single permutation doing perms one after the other
+        state = self.new_state()
+        for perm in perms:
+            self.apply_permutation(state, perm)
+        return self.permutation(state)
+
+    def layers(self, turn, first=None, last=None):
+        # (face, layers counted 1 .. n from that face) a turn letter moves, None when there are no such layers
+        n = self.n
+        if turn in 'xyz':
+            face, layers = 'RUF'['xyz'.index(turn)], range(1, n + 1)
+        elif turn in 'MES':
+            face, layers = 'LDF'['MES'.index(turn)], range(2, n)
+        elif turn.islower():
+            face, layers = turn.upper(), range(1, 3)
+        else:
+            face, layers = turn, range(1, 2)
+        if first is not None:
+            if turn not in CubeData.Faces:
+                return None
+            layers = range(first, (first if last is None else last) + 1)
+        if len(layers) == 0 or layers[0] < 1 or layers[-1] > n:
+            return None
+        return face, layers
+
+    @staticmethod
+    def rotate_vector(vector, axis):
+        # clockwise quarter turn about a unit axis, looking at it from outside: (v . a) a - a x v
+        dot = vector[0] * axis[0] + vector[1] * axis[1] + vector[2] * axis[2]
+        cross = (axis[1] * vector[2] - axis[2] * vector[1], axis[2] * vector[0] - axis[0] * vector[2], axis[0] * vector[1] - axis[1] * vector[0])
+        return tuple(dot * axis[k] - cross[k] for k in range(3))
+
+    def face_turn(self, face):
+        # [(layer, target square, square)] for a clockwise quarter turn of every layer from face, worked out once
+        # per face: a layer turn only picks the entries of its layers
+        turn = self.face_turns.get(face)
+        if turn is None:
+            n, axis = self.n, self.Face_Frames[face][0]
+            turn = []
+            for (position, normal), i in self.squares.items():
+                depth = position[0] * axis[0] + position[1] * axis[1] + position[2] * axis[2]
+                layer = 1 if depth == n else n if depth == -n else (n - 1 - depth) // 2 + 1
+                turn.append((layer, self.squares[(self.rotate_vector(position, axis), self.rotate_vector(normal, axis))], i))
+            turn = self.face_turns[face] = turn
+        return turn
+
+    def layer_permutation(self, face, layers):
+        # clockwise quarter turn (looking at face) of the given layers, built once per (face, layers)
+        key = (face, layers.start, layers.stop)
+        perm = self.quarters.get(key)
+        if perm is None:
+            gathered = list(range(self.size))
+            for layer, target, i in self.face_turn(face):
+                if layer in layers:
+                    gathered[target] = i
+            perm = self.quarters[key] = self.permutation(gathered)
+        return perm
+
+    def turn_permutation(self, rotation):
+        # compile a token into a permutation, None if it is not a turn of this cube
+        perm = self.permutations.get(rotation)
+        if perm is not None:
+            return perm
+        match = self.Turn_Pattern.match(rotation)
+        if match is None:
+            return None
+        count, turn, first, last, inverted = match.groups()
+        layers = self.layers(turn, None if first is None else int(first), None if last is None else int(last))
+        if layers is None:
+            return None
+        quarter = self.layer_permutation(*layers)
+        # multiple / inverted turns are powers of the single quarter turn
+        count = 1 if count is None else int(count)
+        perm = self.compose([quarter] * (4 - count if inverted else count))
+        self.permutations[rotation] = perm
+        return perm
+
+
+CubeData.Translate_Padding = bytes(256 - 54)
+# Zobrist hashing: a fixed random 64 bit key per (square, sticker), xor-ed over the state; seeded so hashes
+# written to disk stay valid between runs
+_random = random.Random(0x5eed_c0be)
+CubeData.Zobrist_Keys = [[_random.getrandbits(64) for _ in range(54)] for _ in range(54)]
+CubeData.All_Squares = CubeData.zobrist_squares(range(54))
+CubeData.Sticker_Colors = ''.join(CubeData.Face_Color_Map[label[0]] for label in CubeData.Sticker_Labels)
+for _turn in CubeData.Turns:
+    for _prefix in ['', '2', '3']:
+        for _suffix in ['', 'i']:
+            CubeData.turn_permutation(f'{_prefix}{_turn}{_suffix}')
+# normalized token -> (turn, clockwise quarter turns), for lazy cubes queueing turns without parsing them
+CubeData.Turn_Quarters = dict((f'{_prefix}{_turn}{_suffix}', (_turn, 4 - _count if _suffix else _count))
+                              for _turn in CubeData.Turns for _count, _prefix in [(1, ''), (2, '2'), (3, '3')] for _suffix in ['', 'i'])
+
+# piece lookups: colors read around a slot -> (piece, orientation), and the stickers that reading stands for
+CubeData.Corner_Stickers = [[CubeData.Sticker_Index[square] for square in corner] for corner in CubeData.Corner_Squares]
+CubeData.Edge_Stickers = [[CubeData.Sticker_Index[square] for square in edge] for edge in CubeData.Edge_Squares]
+CubeData.Center_Stickers = [CubeData.Sticker_Index[square] for square in CubeData.Center_Squares]
+# Cube.freeze(): the first sticker of each corner and edge, then the centers
+CubeData.Freeze_Gather = bytes([stickers[0] for stickers in CubeData.Corner_Stickers + CubeData.Edge_Stickers] + CubeData.Center_Stickers)
+# solved piece counting: each corner's 3 stickers then each edge's 2 stickers (the first repeated) gathered into
+# 20 triples, and a mask of the first byte of every triple
+CubeData.Piece_Gather = bytes(i for stickers in CubeData.Corner_Stickers + [edge + edge[:1] for edge in CubeData.Edge_Stickers] for i in stickers)
+CubeData.Piece_Mask = sum(0xff << (24 * piece) for piece in range(20))
+CubeData.Misplaced_Flags = bytes([0] + [1] * 255)
+CubeData.Corner_Orientations = [[tuple(stickers[o:] + stickers[:o]) for o in range(3)] for stickers in CubeData.Corner_Stickers]
+CubeData.Edge_Orientations = [[tuple(stickers[o:] + stickers[:o]) for o in range(2)] for stickers in CubeData.Edge_Stickers]
+CubeData.Corner_Lookup = dict((''.join(CubeData.Sticker_Colors[sticker] for sticker in stickers), (piece, o))
+                              for piece, orientations in enumerate(CubeData.Corner_Orientations) for o, stickers in enumerate(orientations))
+CubeData.Edge_Lookup = dict((''.join(CubeData.Sticker_Colors[sticker] for sticker in stickers), (piece, o))
+                            for piece, orientations in enumerate(CubeData.Edge_Orientations) for o, stickers in enumerate(orientations))
+# sticker id -> (piece, facelet position within the piece)
+CubeData.Corner_Sticker = dict((sticker, (piece, i)) for piece, corner in enumerate(CubeData.Corner_Stickers) for i, sticker in enumerate(corner))
+CubeData.Edge_Sticker = dict((sticker, (piece, i)) for piece, edge in enumerate(CubeData.Edge_Stickers) for i, sticker in enumerate(edge))
+# the 24 center arrangements reachable with slice turns: center stickers -> index, center colors -> (stickers, parity)
+CubeData.Center_Orientations = [bytes(CubeData.Center_Stickers)]
+for _centers in CubeData.Center_Orientations:
+    for _turn in ['M', 'E', 'S']:
+        _state = bytearray(CubeData.Solved_State)
+        for _i, _center in zip(CubeData.Center_Stickers, _centers):
+            _state[_i] = _center
+        CubeData.apply_permutation(_state, CubeData.Turn_Permutations[_turn])
+        _moved = bytes(_state[_i] for _i in CubeData.Center_Stickers)
+        if _moved not in CubeData.Center_Orientations:
+            CubeData.Center_Orientations.append(_moved)
+CubeData.Center_Orientation_Index = dict((centers, i) for i, centers in enumerate(CubeData.Center_Orientations))
+# a center arrangement's parity is the parity the corner and edge permutations must differ by
+CubeData.Center_Parities = [CubeData.parity([CubeData.Center_Stickers.index(sticker) for sticker in centers]) for centers in CubeData.Center_Orientations]
+CubeData.Center_Lookup = dict((''.join(CubeData.Sticker_Colors[sticker] for sticker in centers), (centers, parity))
+                              for centers, parity in zip(CubeData.Center_Orientations, CubeData.Center_Parities))
+
+# the 48 whole cube symmetries, their move mappings and the center orientation fixes are only needed by
+# canonical_form, so they are built on first use by CubeData.symmetries() / symmetry_moves() / orientation_fix()
+CubeData.Face_Normals = {'R': (1, 0, 0), 'L': (-1, 0, 0), 'U': (0, 1, 0), 'D': (0, -1, 0), 'F': (0, 0, 1), 'B': (0, 0, -1)}
+CubeData.Center_Gather = bytes(CubeData.Center_Stickers)
+
+
+class CompiledSequence:
+    # a simplified move sequence fused into a single sticker permutation
+    def __init__(self, moves, permutation):
+        self.moves = tuple(moves)
+        self.notation = ' '.join(self.moves)
+        self.permutation = permutation
+
+    def __len__(self):
+        return len(self.moves)
+
+    def __str__(self):
+        return self.notation
+
+    def __repr__(self):
+        return f'CompiledSequence({self.notation!r})'
+
+
+class SequenceCompiler:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+
+    @staticmethod
+    def parse(moves):
+        # split into (direction, quarter turns) pairs
+        if isinstance(moves, str):
+            moves = moves.split()
+        parsed = []
+        for move in moves:
+            match = CubeData.Turn_Pattern.match(move)
+            if match is None:
+                raise ValueError(f'Invalid Rotation: {move}')
+            pattern = match.groups()
+            rotations = 1 if pattern[0] is None else int(pattern[0])
+            parsed.append((pattern[1], 4 - rotations if pattern[2] is not None else rotations))
+        return parsed
+
+    @staticmethod
+    def simplify(moves):
+        # moves on one axis commute, so each run of same-axis moves collapses to one net turn per direction
+        runs = []
+        for direction, rotations in SequenceCompiler.parse(moves):
+            axis = CubeData.Turn_Axis[direction]
+            if not runs or runs[-1][0] != axis:
+                runs.append((axis, OrderedDict()))
+            turns = runs[-1][1]
+            turns[direction] = (turns.get(direction, 0) + rotations) % 4
+            if turns[direction] == 0:
+                del turns[direction]
+                if not turns:
+                    runs.pop()
+        return [SequenceCompiler.notation(direction, rotations) for _, turns in runs for direction, rotations in turns.items()]
+
+    @staticmethod
+    def notation(direction, rotations):
+        return {1: f'{direction}', 2: f'2{direction}', 3: f'{direction}i'}[rotations]
+
+    def compile(self, moves):
+        if isinstance(moves, CompiledSequence):
+            return moves
+        # the input as given is looked up first so a hit costs one hash; only a miss pays for simplify(), whose
+        # result is cached too, so spellings of one sequence share a compiled entry
+        raw = moves if isinstance(moves, str) else tuple(moves)
+        compiled = self._cache.get(raw)
+        if compiled is not None:
+            self.hits += 1
+            self._cache.move_to_end(raw)
+            return compiled
+        simplified = self.simplify(raw)
+        key = ' '.join(simplified)
+        compiled = self._cache.get(key)
+        if compiled is not None:
+            self.hits += 1
+            self._cache.move_to_end(key)
+        else:
+            self.misses += 1
+            # composing permutations is the same as applying them to the identity state
+            permutation = bytearray(CubeData.Solved_State)
+            for move in simplified:
+                CubeData.apply_permutation(permutation, CubeData.Turn_Permutations[move])
+            compiled = CompiledSequence(simplified, bytes(permutation))
+            self._cache[key] = compiled
+        self._cache[raw] = compiled
+        self._trim()
+        return compiled
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        self._trim()
+
+    def _trim(self):
+        while len(self._cache) > max(self.maxsize, 0):
+            self._cache.popitem(last=False)
+
+    def clear(self):
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def cache_info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._cache), 'maxsize': self.maxsize}
+
+
+Sequence_Compiler = SequenceCompiler()
+
+
+def compile_sequence(moves):
+    return Sequence_Compiler.compile(moves)
+
+
+def canonical_form(state):
+    # (key, rotation tokens, symmetry index): the rotation tokens bring the centers home, then the symmetry's
+    # relabelling gives key, the least of the 48 symmetric images; a move sequence that solves key solves the
+    # rotated state once mapped through CubeData.symmetry_moves()[symmetry index]
+    rotation, perm = CubeData.orientation_fix()[CubeData.Center_Gather.translate(state + CubeData.Translate_Padding)]
+    oriented = perm.translate(state + CubeData.Translate_Padding) + CubeData.Translate_Padding
+    key, symmetry = None, 0
+    for index, (gather, relabel) in enumerate(CubeData.symmetries()):
+        image = gather.translate(oriented).translate(relabel)
+        if key is None or image < key:
+            key, symmetry = image, index
+    return key, rotation, symmetry
+
+
+def canonical(state):
+    return canonical_form(state)[0]
+
+
+class TranspositionCache:
+    # bounded LRU of results keyed by canonical state, so symmetric duplicates share one entry
+    def __init__(self, maxsize=65536):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.memory = 0
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    def get(self, key, default=None):
+        value = self._cache.get(key, self)
+        if value is self:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._cache.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if key in self._cache:
+            self.memory -= sys.getsizeof(self._cache[key])
+            self._cache.move_to_end(key)
+        else:
+            self.memory += sys.getsizeof(key)
+        self._cache[key] = value
+        self.memory += sys.getsizeof(value)
+        self._trim()
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        self._trim()
+
+    def _trim(self):
+        while len(self._cache) > max(self.maxsize, 0):
+            key, value = self._cache.popitem(last=False)
+            self.memory -= sys.getsizeof(key) + sys.getsizeof(value)
+
+    def clear(self):
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
+        self.memory = 0
+
+    def cache_info(self):
+        # memory: keys and values (shallow) plus the table itself
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._cache), 'maxsize': self.maxsize, 'memory': self.memory + sys.getsizeof(self._cache)}
+
+
+class SolvedCounts:
+    # misplaced sticker counts per face and solved corner / edge counts for one state; turns only mark the faces
+    # they touch and the first count query after them recounts (one pass over the 54 stickers), so a run of turns
+    # costs a single recount and queries without turns in between are free; is_solved() does not use them
+    def __init__(self, state):
+        self.state = state
+        self.face_misplaced = [0] * 6
+        self.dirty = 0x3f
+        self.update()
+
+    def update(self):
+        # a sticker is home when its byte equals its index, so the xor with the solved state is 0 there
+        squares = (int.from_bytes(self.state, 'little') ^ CubeData.Solved_Value).to_bytes(54, 'little')
+        misplaced = self.face_misplaced
+        for face in range(6):
+            if self.dirty >> face & 1:
+                misplaced[face] = 9 - squares.count(0, face * 9, face * 9 + 9)
+        self.misplaced = sum(misplaced)
+        # 0 / 1 misplaced flag per piece sticker, summed per triple into the triple's first byte
+        flags = int.from_bytes(CubeData.Piece_Gather.translate(squares.translate(CubeData.Misplaced_Flags) + CubeData.Translate_Padding), 'little')
+        pieces = ((flags + (flags >> 8) + (flags >> 16)) & CubeData.Piece_Mask).to_bytes(60, 'little')
+        self.solved_corners = pieces.count(0, 0, 24) - 16
+        self.solved_edges = pieces.count(0, 24, 60) - 24
+        self.dirty = 0
+        return self
+
+
 class Face:
-    def __init__(self, face):
+    def __init__(self, face, state=None, cube=None, n=3):
         self.name = face
-        self.solved_config = [[f'{self.name}{j}' for j in range(i,i + 3)] for i in range(1,10,3)]
-        self.face = [[f'{self.name}{j}' for j in range(i,i + 3)] for i in range(1,10,3)]
+        self.number = CubeData.Faces.index(face)
+        self.geometry = CubeGeometry.get(n)
+        self.n = n
+        self.area = n * n
+        self.offset = self.number * self.area
+        self.state = self.geometry.new_state() if state is None else state
+        self.cube = cube
+        self.solved_config = [[f'{self.name}{j}' for j in range(i, i + n)] for i in range(1, self.area + 1, n)]
+
+    @property
+    def face(self):
+        if self.cube is not None and self.cube.pending:
+            self.cube.flush()
+        squares = [self.geometry.labels[sticker] for sticker in self.state[self.offset:self.offset + self.area]]
+        return [squares[i:i + self.n] for i in range(0, self.area, self.n)]
 
     def __str__(self):
         out = f'{CubeData.Face_Strings[self.name]:<5} | '
@@ -176,29 +805,44 @@ class Face:
         return out
 
     def __repr__(self):
+        width = len(self.geometry.labels[-1])
         out = f'{CubeData.Face_Strings[self.name]:<5} | '
-        out += ' |\n      | '.join(['  '.join(row) for row in self.face])
+        out += ' |\n      | '.join(['  '.join(f'{square:<{width}}' for square in row) for row in self.face])
         out += ' |'
         return out
 
     def __getitem__(self, item):
-        row = (item - 1) // 3
-        col = (item - 1) % 3
-        return self.face[row][col]
+        if self.cube is not None and self.cube.pending:
+            self.cube.flush()
+        return self.geometry.labels[self.state[self.offset + item - 1]]
 
     def __setitem__(self, item, value):
-        row = (item - 1) // 3
-        col = (item - 1) % 3
-        self.face[row][col] = value
+        if self.cube is not None and self.cube.pending:
+            self.cube.flush()
+        self.state[self.offset + item - 1] = self.geometry.index[value]
+        if self.cube is not None:
+            self.cube.touch(1 << self.number)
 
     def is_solved(self):
-        return self.face == self.solved_config
+        if self.cube is not None:
+            return self.cube.solved_counts().face_misplaced[self.number] == 0
+        return self.state[self.offset:self.offset + self.area] == self.geometry.solved[self.offset:self.offset + self.area]
 
 
-class Cube:
-    def __init__(self, configuration=None):
-        self.debug = False
-        self.build_configuration(configuration)
+class NxNCube:
+    # an n x n x n cube turned with CubeGeometry tokens (R, 2Ui, r, M, x, R.2, R.1-3 ...); Cube is the n = 3
+    # case with the 3x3 extras (validation, solved counters, hashing, observers) on top
+    def __init__(self, n=3, state=None):
+        self.n = n
+        self.geometry = CubeGeometry.get(n)
+        self.state = self.geometry.new_state()
+        if state is not None:
+            if len(state) != self.geometry.size:
+                raise ValueError(f'state must have {self.geometry.size} stickers')
+            self.state[:] = bytearray(state) if self.geometry.narrow else array.array('H', state)
+        self.configuration = {}
+        for face in CubeData.Faces:
+            self.configuration[face] = Face(face, self.state, n=n)
 
     def __str__(self):
         return '\n\n'.join(str(self.configuration[face]) for face in self.configuration.keys()) + f'\n\nCube solved: {self.is_solved()}'
@@ -208,189 +852,675 @@ class Cube:
 
     def __getitem__(self, item):
         try:
-            match = CubeData.Square_Pattern.match(item).groups()
+            match = self.geometry.Square_Pattern.match(item).groups()
             face, square = match[0].upper(), int(match[1])
+            if not 1 <= square <= self.geometry.area:
+                return None
             return self.configuration[face][square]
         except:
             return None
 
+    @classmethod
+    def from_state(cls, state):
+        n = 2
+        while 6 * n * n < len(state):
+            n += 1
+        return cls(n, state)
+
+    def to_configuration(self):
+        if self.geometry.narrow:
+            colors = self.state.translate(self.geometry.color_table).decode()
+        else:
+            colors = ''.join(self.geometry.colors[sticker] for sticker in self.state)
+        area = self.geometry.area
+        return [colors[i:i + area] for i in range(0, self.geometry.size, area)]
+
+    def is_solved(self):
+        return self.state == self.geometry.solved
+
+    def rotate(self, rotation):
+        perm = self.geometry.turn_permutation(rotation)
+        if perm is None:
+            logger.warning('Invalid Rotation: %s', rotation)
+            return
+        self.geometry.apply_permutation(self.state, perm)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('@Rotating: %s', rotation.replace('i', '\''))
+
+    def rotate_sequence(self, rotations):
+        # whole sequence applied as one composed permutation
+        if isinstance(rotations, str):
+            rotations = rotations.split()
+        perms = []
+        for rotation in rotations:
+            perm = self.geometry.turn_permutation(rotation)
+            if perm is None:
+                raise ValueError(f'Invalid Rotation: {rotation}')
+            perms.append(perm)
+        self.geometry.apply_permutation(self.state, self.geometry.compose(perms))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('@Rotating: %s', ' '.join(rotations).replace('i', '\''))
+
+
+class Cube(NxNCube):
+    n = 3
+    geometry = CubeGeometry.get(3)
+
+    def __init__(self, configuration=None):
+        self.debug = False
+        # observer(cube, moves) is called after every rotate / rotate_sequence with the tuple of applied tokens
+        self.observers = []
+        self.move_log = None
+        # lazy mode: turns wait in pending, as runs of same axis turns (axis, direction -> quarter turns) that
+        # cancel and merge as they come, until the state is observed
+        self.lazy = False
+        self.pending = []
+        self.elided_moves = 0
+        self.build_configuration(configuration)
+
+    @property
+    def state(self):
+        if self.pending:
+            self.flush()
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        self.pending = []
+        self._state = state
+
+    @classmethod
+    def from_state(cls, state):
+        cube = cls()
+        cube.state[:] = state
+        cube.touch()
+        return cube
+
     def build_configuration(self, configuration):
+        self.state = bytearray(CubeData.Solved_State)
+        if configuration is not None and isinstance(configuration, (list, tuple)):
+            try:
+                self.state[:] = CubeData.decode_configuration(configuration)
+            except ValueError:
+                pass
+        self.counts = SolvedCounts(self._state)
+        self.zobrist_value = CubeData.zobrist(self._state)
+        self.zobrist_state = bytes(self._state)
+        self.zobrist_moved = 0
         self.configuration = {}
         for face in CubeData.Faces:
-            self.configuration[face] = Face(face)
-        if configuration is not None and self.is_valid_configuration(configuration):
-            try:
-                _config = {}
-                for enum, face in enumerate(CubeData.Faces):
-                    _config[face] = ' ' + configuration[enum]
-                
-                for face in 'RLUDFB':
-                    for square in range(1, 10):
-                        # corners
-                        if face in 'RL' and square in [1, 3, 7, 9]:
-                            refsquare1 = f'{face}{square}'
-                            refsquare2, refsquare3 = CubeData.Square_Reference[refsquare1]
-                            face2, square2 = refsquare2[0], int(refsquare2[1])
-                            face3, square3 = refsquare3[0], int(refsquare3[1])
-                            color_1 = _config[face][square]
-                            color_2 = _config[face2][square2]
-                            color_3 = _config[face3][square3]
-                            face_val1, face_val2, face_val3 = CubeData.Corner_Color_Map[color_1][color_2][color_3]
-                            self.configuration[face][square] = face_val1
-                            self.configuration[face2][square2] = face_val2
-                            self.configuration[face3][square3] = face_val3
-                        # edges
-                        elif face in 'RLUD' and square in [2, 4, 6, 8]:
-                            if face in 'UD' and square in [4, 6]:
-                                continue
-                            refsquare1 = f'{face}{square}'
-                            refsquare2 = CubeData.Square_Reference[refsquare1]
-                            face2, square2 = refsquare2[0], int(refsquare2[1])
-                            color_1 = _config[face][square]
-                            color_2 = _config[face2][square2]
-                            face_val1, face_val2 = CubeData.Edge_Color_Map[color_1][color_2]
-                            self.configuration[face][square] = face_val1
-                            self.configuration[face2][square2] = face_val2
-                        # flats
-                        elif square == 5:
-                            color_1 = _config[face][square]
-                            face_val1 = CubeData.Flat_Color_Map[color_1]
-                            self.configuration[face][square] = face_val1
-            except:
-                self.configuration = {}
-                for face in CubeData.Faces:
-                    self.configuration[face] = Face(face)
+            self.configuration[face] = Face(face, self._state, self)
 
     def is_valid_configuration(self, configuration):
         # ensure configuration is list or tuple
         if not (isinstance(configuration, list) or isinstance(configuration, tuple)):
             return False
-        # ensure configuration has 6 faces
-        if not len(configuration) == 6:
-            return False
-        # ensure each face has 9 squares
-        if not all(len(face) == 9 for face in configuration):
-            return False
-        # ensure all squares are in color list
-        if not all(all(square in CubeData.Colors for square in face) for face in configuration):
-            return False
-        # ensure all colors total 9 for entire configuration
-        if not all(sum(face.count(color) for face in configuration) == 9 for color in CubeData.Colors):
-            return False
-        # ensure each flat has exactly 1 of each color
-        if not all(''.join(face[4] for face in configuration).count(color) == 1 for color in CubeData.Colors):
-            return False
-        # ensure corners and edges are valid
-        edge_count = dict((key, 0) for key in CubeData.Valid_Edges.keys())
-        corner_count = dict((key, 0) for key in CubeData.Valid_Corners.keys())
-        _config = {}
-        for enum, face in enumerate(CubeData.Faces):
-            _config[face] = ' ' + configuration[enum]
-        for face in 'RLUD':
-            for square in range(1, 10):
-                if square == 5:
-                    continue
-                elif face in 'RL' and square in [1, 3, 7, 9]:
-                    refsquare1 = f'{face}{square}'
-                    refsquare2, refsquare3 = CubeData.Square_Reference[refsquare1]
-                    face2, square2 = refsquare2[0], int(refsquare2[1])
-                    face3, square3 = refsquare3[0], int(refsquare3[1])
-                    color_1 = _config[face][square]
-                    color_2 = _config[face2][square2]
-                    color_3 = _config[face3][square3]
-                    for key in CubeData.Valid_Corners.keys():
-                        if f'{color_1}{color_2}{color_3}' in CubeData.Valid_Corners[key]:
-                            corner_count[key] += 1
-                elif square in [2, 4, 6, 8]:
-                    if face in 'UD' and square in [4, 6]:
-                        continue
-                    refsquare1 = f'{face}{square}'
-                    refsquare2 = CubeData.Square_Reference[refsquare1]
-                    face2, square2 = refsquare2[0], int(refsquare2[1])
-                    color_1 = _config[face][square]
-                    color_2 = _config[face2][square2]
-                    for key in CubeData.Valid_Edges.keys():
-                        if f'{color_1}{color_2}' in CubeData.Valid_Edges[key]:
-                            edge_count[key] += 1
-        if not all(corner_count[key] == 1 for key in corner_count.keys()):
-            return False
-        if not all(edge_count[key] == 1 for key in edge_count.keys()):
+        # colors, pieces, twist, flip and parity are all checked while decoding
+        try:
+            CubeData.decode_configuration(configuration)
+        except ValueError:
             return False
         return True
 
-    def toggle_debug(self):
+    def toggle_debug(self, pause=True):
         self.debug = not self.debug
         if self.debug:
             print('DEBUG enabled.\n')
-            self.debug_out()
+            self.debug_pause = pause
+            self.add_observer(Cube.debug_observer)
+            self.debug_out(pause)
         else:
+            self.remove_observer(Cube.debug_observer)
             print('DEBUG disabled.\n')
 
-    def debug_out(self):
+    def debug_out(self, pause=True):
         print(self)
         print(repr(self))
-        _ = input('Press enter to continue...\n')
+        if pause:
+            _ = input('Press enter to continue...\n')
+
+    def debug_observer(self, moves):
+        self.debug_out(self.debug_pause)
+
+    def add_observer(self, observer):
+        if observer not in self.observers:
+            self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        if observer in self.observers:
+            self.observers.remove(observer)
+
+    def enable_move_log(self, maxlen=1024):
+        # ring buffer of the last maxlen applied tokens (None keeps everything)
+        self.move_log = deque(self.move_log or (), maxlen=maxlen)
+        return self.move_log
+
+    def disable_move_log(self):
+        self.move_log = None
+
+    def enable_lazy(self):
+        # rotate / rotate_sequence only queue their turns; elided_moves counts the turns that cancelled or merged
+        self.lazy = True
+
+    def disable_lazy(self):
+        self.flush()
+        self.lazy = False
+
+    def pending_moves(self):
+        return [SequenceCompiler.notation(direction, rotations) for _, turns in self.pending for direction, rotations in turns.items()]
+
+    def queue(self, direction, rotations):
+        # same axis turns commute, so a turn joins the last run when it shares its axis; a run that cancels out
+        # is dropped, which lets the run before it meet the next turn
+        pending = self.pending
+        axis = CubeData.Turn_Axis[direction]
+        if not pending or pending[-1][0] != axis:
+            pending.append((axis, {}))
+        turns = pending[-1][1]
+        # elided as they happen, so the counts hold even when the queue cancels to nothing and is never flushed:
+        # a merge saves this turn, a cancel saves it and the queued turn it undoes
+        if direction in turns:
+            self.elided_moves += 1
+        turns[direction] = (turns.get(direction, 0) + rotations) % 4
+        if turns[direction] == 0:
+            self.elided_moves += 1
+            del turns[direction]
+            if not turns:
+                pending.pop()
+
+    def flush(self):
+        # apply the pending turns, already cancelled / merged, to the sticker state
+        moves = self.pending_moves()
+        self.pending = []
+        for move in moves:
+            perm = CubeData.turn_permutation(move)
+            CubeData.apply_permutation(self._state, perm)
+            faces, moved = CubeData.turn_changes(perm)
+            self.counts.dirty |= faces
+            self.zobrist_moved |= moved
+
+    def notify(self, moves):
+        if self.move_log is not None:
+            self.move_log.extend(moves)
+        for observer in self.observers:
+            observer(self, moves)
+
+    def __eq__(self, other):
+        if not isinstance(other, Cube):
+            return NotImplemented
+        return self.state == other.state
+
+    def __hash__(self):
+        return self.zobrist()
+
+    def touch(self, faces=0x3f):
+        # the state was written directly instead of turned: recount those faces and rehash every square
+        self.counts.dirty |= faces
+        self.zobrist_moved = CubeData.All_Moved
+
+    def zobrist(self):
+        # 64 bit hash kept up to date from the union of the squares the turns since the last call moved; it is
+        # for __hash__, bulk dedupe of many states should key on freeze(), which is exact and cheaper
+        if self.pending:
+            self.flush()
+        if self.zobrist_moved:
+            # keys of unchanged squares cancel out
+            moved = CubeData.moved_squares(self.zobrist_moved)
+            self.zobrist_value ^= CubeData.zobrist(self.zobrist_state, moved) ^ CubeData.zobrist(self._state, moved)
+            self.zobrist_state = bytes(self._state)
+            self.zobrist_moved = 0
+        return self.zobrist_value
+
+    def freeze(self):
+        # immutable exact key for sets, dicts and on-disk indexes: 26 bytes, one sticker per corner and edge (which
+        # fixes its piece and orientation) and the six centers, so distinct states never share a key; the lossy
+        # Zobrist hash is only used by __hash__
+        return CubeData.Freeze_Gather.translate(self.state + CubeData.Translate_Padding)
+
+    def canonical(self):
+        return canonical(self.state)
+
+    def solved_counts(self):
+        if self.pending:
+            self.flush()
+        return self.counts.update() if self.counts.dirty else self.counts
 
     def is_solved(self):
-        return all(self.configuration[face].is_solved() for face in self.configuration.keys())
+        # one bytes compare, cheaper than any recount right after a turn
+        return self.state == CubeData.Solved_State
+
+    def misplaced_count(self, face=None):
+        # stickers not on their home square, on the whole cube or on one face
+        if face is None:
+            return self.solved_counts().misplaced
+        return self.solved_counts().face_misplaced[CubeData.Faces.index(face)]
+
+    def solved_pieces(self):
+        # (corners, edges) sitting in their home slot with the right orientation
+        counts = self.solved_counts()
+        return counts.solved_corners, counts.solved_edges
 
     def rotate(self, rotation):
-        # parse patern from string to determine parts of the rotation (numbers of rotation, inversions, and main rotation)
-        pattern = CubeData.Turn_Pattern.match(rotation).groups()
+        # look up the precompiled sticker permutation for the rotation (numbers of rotation, inversions, and main rotation)
+        if self.lazy:
+            turn = CubeData.Turn_Quarters.get(rotation)
+            if turn is None:
+                if CubeData.turn_permutation(rotation) is None:
+                    logger.warning('Invalid Rotation: %s', rotation)
+                    return
+                turn = SequenceCompiler.parse((rotation,))[0]
+            self.queue(*turn)
+        else:
+            perm = CubeData.turn_permutation(rotation)
+            if perm is None:
+                logger.warning('Invalid Rotation: %s', rotation)
+                return
+            CubeData.apply_permutation(self._state, perm)
+            faces, moved = CubeData.turn_changes(perm)
+            self.counts.dirty |= faces
+            self.zobrist_moved |= moved
+        # nothing is formatted or written unless someone is listening
+        if self.observers or self.move_log is not None:
+            self.notify((rotation,))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('@Rotating: %s', rotation.replace('i', '\''))
 
-        if pattern is not None:
-            rotations = 1 if pattern[0] is None else int(pattern[0])
-            direction = pattern[1]
-            inverted = True if pattern[2] is not None else False
-            # store 'old' configuration temporarily
-            _temp = {}
-            for face in self.configuration.keys():
-                _temp[face] = dict([(i + 1, self.configuration[face][i + 1]) for i in range(9)])
-            # turn face
-            if direction in 'RrLlUuDdFfBb':
-                if direction in 'Rr':
-                    turn_data = CubeData.Turn_Map['R']
-                elif direction in 'Ll':
-                    turn_data = CubeData.Turn_Map['L']
-                elif direction in 'Uu':
-                    turn_data = CubeData.Turn_Map['U']
-                elif direction in 'Dd':
-                    turn_data = CubeData.Turn_Map['D']
-                elif direction in 'Ff':
-                    turn_data = CubeData.Turn_Map['F']
-                elif direction in 'Bb':
-                    turn_data = CubeData.Turn_Map['B']
-                _rotations = 4 - rotations if inverted else rotations
-                for face in turn_data.keys():
-                    for key in turn_data[face][1].keys():
-                        new_face, new_key = CubeData.rotation_keys(turn_data, face, key, _rotations)
-                        self.configuration[face][key] = _temp[new_face][new_key]
-
-            # turn centers
-            if direction in 'MESrludfb':
-                if direction in 'Mrl':
-                    turn_data = CubeData.Turn_Map['M']
-                    _rotations = 4 - rotations if (direction == 'r' and not inverted) or (direction != 'r' and inverted) else rotations
-                elif direction in 'Eud':
-                    turn_data = CubeData.Turn_Map['E']
-                    _rotations = 4 - rotations if (direction =='u' and not inverted) or (direction != 'u' and inverted) else rotations
-                elif direction in 'Sfb':
-                    turn_data = CubeData.Turn_Map['S']
-                    _rotations = 4 - rotations if (direction == 'b' and not inverted) or (direction != 'b' and inverted) else rotations
-                for face in turn_data.keys():
-                    for key in turn_data[face][1].keys():
-                        new_face, new_key = CubeData.rotation_keys(turn_data, face, key, _rotations)
-                        self.configuration[face][key] = _temp[new_face][new_key]
-                    
-            rotation = rotation.replace('i', '\'')
-            print(f'@Rotating: {rotation}')
+    def rotate_sequence(self, rotations):
+        # observers and the move log get the tokens as given, lazy or not, rather than the simplified sequence
+        moves = rotations.moves if isinstance(rotations, CompiledSequence) else rotations
+        moves = tuple(moves.split() if isinstance(moves, str) else moves)
+        if self.lazy:
+            # queued turn by turn, so they also cancel with the turns around the sequence
+            for direction, quarters in SequenceCompiler.parse(moves):
+                self.queue(direction, quarters)
+            if self.observers or self.move_log is not None:
+                self.notify(moves)
+            return
+        # whole sequence applied as one precompiled permutation
+        sequence = compile_sequence(rotations)
+        CubeData.apply_permutation(self.state, sequence.permutation)
+        # a fused sequence touches most of the cube, so every face is recounted rather than caching its changes
+        self.touch()
+        if self.observers or self.move_log is not None:
+            self.notify(moves)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('@Rotating: %s', sequence.notation.replace('i', '\''))
+
+
+class CubeBatch:
+    # N cubes stored as rows of an (N, 54) uint8 sticker array, same layout as Cube.state
+    def __init__(self, count=1, states=None):
+        if import_numpy() is None:
+            raise ImportError('CubeBatch requires numpy')
+        if states is None:
+            self.states = np.tile(CubeBatch.solved_row(), (count, 1))
         else:
-            print(f'Invalid Rotation: {rotation}')
-        if self.debug:
-            self.debug_out()
+            self.states = np.array(states, dtype=np.uint8).reshape(-1, 54)
+
+    def __len__(self):
+        return len(self.states)
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            return Cube.from_state(bytes(self.states[item]))
+        return CubeBatch(states=self.states[item])
+
+    @staticmethod
+    def solved_row():
+        import_numpy()
+        return np.frombuffer(CubeData.Solved_State, dtype=np.uint8)
+
+    @staticmethod
+    def move_table():
+        # (moves, 54) gather table, row i is the permutation for CubeBatch.move_tokens()[i]
+        if not hasattr(CubeBatch, '_Move_Table'):
+            import_numpy()
+            CubeBatch._Move_Tokens = list(CubeData.Turn_Permutations.keys())
+            CubeBatch._Move_Ids = dict((token, i) for i, token in enumerate(CubeBatch._Move_Tokens))
+            CubeBatch._Move_Table = np.array([list(CubeData.Turn_Permutations[token]) for token in CubeBatch._Move_Tokens], dtype=np.intp)
+        return CubeBatch._Move_Table
+
+    @staticmethod
+    def move_tokens():
+        CubeBatch.move_table()
+        return CubeBatch._Move_Tokens
+
+    @staticmethod
+    def move_ids(moves):
+        CubeBatch.move_table()
+        ids = []
+        for move in moves:
+            if move not in CubeBatch._Move_Ids:
+                perm = CubeData.turn_permutation(move)
+                if perm is None:
+                    raise ValueError(f'Invalid Rotation: {move}')
+                move = next(token for token in CubeBatch._Move_Tokens if CubeData.Turn_Permutations[token] is perm)
+            ids.append(CubeBatch._Move_Ids[move])
+        return np.array(ids, dtype=np.intp)
+
+    @classmethod
+    def from_cubes(cls, cubes):
+        import_numpy()
+        return cls(states=np.array([np.frombuffer(bytes(cube.state), dtype=np.uint8) for cube in cubes], dtype=np.uint8))
+
+    @classmethod
+    def from_configurations(cls, configurations):
+        states, valid = CubeBatch.decode_configurations(configurations)
+        if not valid.all():
+            raise ValueError(f'invalid configuration at row {int(np.flatnonzero(~valid)[0])}')
+        return cls(states=states)
+
+    @staticmethod
+    def validate_configurations(configurations):
+        return CubeBatch.decode_configurations(configurations)[1]
+
+    @staticmethod
+    def decode_tables():
+        # CubeData lookups as arrays indexed by color codes (0-5 in CubeData.Colors order, 6 for anything else)
+        if not hasattr(CubeBatch, '_Decode_Tables'):
+            import_numpy()
+            codes = dict((color, i) for i, color in enumerate(CubeData.Colors))
+            color_codes = np.full(256, 6, dtype=np.int64)
+            for color, code in codes.items():
+                color_codes[ord(color)] = code
+            corner_lookup = np.full(7 ** 3, 255, dtype=np.int64)
+            for colors, (piece, orientation) in CubeData.Corner_Lookup.items():
+                corner_lookup[(codes[colors[0]] * 7 + codes[colors[1]]) * 7 + codes[colors[2]]] = piece * 3 + orientation
+            edge_lookup = np.full(7 ** 2, 255, dtype=np.int64)
+            for colors, (piece, orientation) in CubeData.Edge_Lookup.items():
+                edge_lookup[codes[colors[0]] * 7 + codes[colors[1]]] = piece * 2 + orientation
+            center_lookup = np.full(7 ** 6, 255, dtype=np.int64)
+            center_parity = np.zeros(len(CubeData.Center_Orientations), dtype=np.int64)
+            for colors, (centers, parity) in CubeData.Center_Lookup.items():
+                key = 0
+                for color in colors:
+                    key = key * 7 + codes[color]
+                center_lookup[key] = CubeData.Center_Orientation_Index[centers]
+                center_parity[CubeData.Center_Orientation_Index[centers]] = parity
+            CubeBatch._Decode_Tables = {
+                'color_codes': color_codes, 'corner_lookup': corner_lookup, 'edge_lookup': edge_lookup,
+                'center_lookup': center_lookup, 'center_parity': center_parity,
+                'corner_stickers': np.array(CubeData.Corner_Stickers), 'edge_stickers': np.array(CubeData.Edge_Stickers),
+                'center_stickers': np.array(CubeData.Center_Stickers),
+                'corner_values': np.array([stickers for orientations in CubeData.Corner_Orientations for stickers in orientations], dtype=np.uint8),
+                'edge_values': np.array([stickers for orientations in CubeData.Edge_Orientations for stickers in orientations], dtype=np.uint8),
+                'center_values': np.array([list(centers) for centers in CubeData.Center_Orientations], dtype=np.uint8)}
+        return CubeBatch._Decode_Tables
+
+    @staticmethod
+    def _parity(pieces):
+        upper = np.triu(np.ones((pieces.shape[1], pieces.shape[1]), dtype=bool), 1)
+        return ((pieces[:, :, None] > pieces[:, None, :]) & upper).sum(axis=(1, 2)) % 2
+
+    @staticmethod
+    def decode_configurations(configurations):
+        # vectorized CubeData.decode_configuration: (N, 54) states and an (N,) validity mask, invalid rows are left solved
+        import_numpy()
+        tables = CubeBatch.decode_tables()
+        rows = []
+        for configuration in configurations:
+            colors = configuration if isinstance(configuration, str) else ''.join(configuration)
+            rows.append(colors if len(colors) == 54 else '?' * 54)
+        if not rows:
+            return np.zeros((0, 54), dtype=np.uint8), np.zeros(0, dtype=bool)
+        codes = tables['color_codes'][np.frombuffer(''.join(rows).encode('ascii', 'replace'), dtype=np.uint8).reshape(-1, 54)]
+
+        corner_colors = codes[:, tables['corner_stickers']]
+        corners = tables['corner_lookup'][(corner_colors[:, :, 0] * 7 + corner_colors[:, :, 1]) * 7 + corner_colors[:, :, 2]]
+        edge_colors = codes[:, tables['edge_stickers']]
+        edges = tables['edge_lookup'][edge_colors[:, :, 0] * 7 + edge_colors[:, :, 1]]
+        center_keys = np.zeros(len(codes), dtype=np.int64)
+        for i in range(6):
+            center_keys = center_keys * 7 + codes[:, tables['center_stickers'][i]]
+        centers = tables['center_lookup'][center_keys]
+
+        valid = (corners != 255).all(axis=1) & (edges != 255).all(axis=1) & (centers != 255)
+        corners, edges, centers = np.where(corners == 255, 0, corners), np.where(edges == 255, 0, edges), np.where(centers == 255, 0, centers)
+        corner_pieces, edge_pieces = corners // 3, edges // 2
+        valid &= (np.sort(corner_pieces, axis=1) == np.arange(8)).all(axis=1)
+        valid &= (np.sort(edge_pieces, axis=1) == np.arange(12)).all(axis=1)
+        valid &= (corners % 3).sum(axis=1) % 3 == 0
+        valid &= (edges % 2).sum(axis=1) % 2 == 0
+        valid &= CubeBatch._parity(corner_pieces) ^ CubeBatch._parity(edge_pieces) == tables['center_parity'][centers]
+
+        states = np.tile(CubeBatch.solved_row(), (len(codes), 1))
+        states[:, tables['corner_stickers']] = tables['corner_values'][corners]
+        states[:, tables['edge_stickers']] = tables['edge_values'][edges]
+        states[:, tables['center_stickers']] = tables['center_values'][centers]
+        states[~valid] = CubeBatch.solved_row()
+        return states, valid
+
+    def to_cubes(self):
+        return [Cube.from_state(bytes(row)) for row in self.states]
+
+    def to_configurations(self):
+        colors = np.frombuffer(CubeData.Sticker_Colors.encode(), dtype=np.uint8)[self.states]
+        return [[row[i:i + 9] for i in range(0, 54, 9)] for row in colors.view('S54').ravel().astype(str)]
 
+    def copy(self):
+        return CubeBatch(states=self.states.copy())
+
+    def zobrist(self):
+        # (N,) uint64 Zobrist hashes, equal to Cube.zobrist() of each row
+        if not hasattr(CubeBatch, '_Zobrist_Table'):
+            CubeBatch._Zobrist_Table = np.array(CubeData.Zobrist_Keys, dtype=np.uint64)
+        return np.bitwise_xor.reduce(CubeBatch._Zobrist_Table[np.arange(54), self.states], axis=1)
+
+    def rotate(self, rotation):
+        # same rotation for every row
+        perm = CubeData.turn_permutation(rotation)
+        if perm is None:
+            raise ValueError(f'Invalid Rotation: {rotation}')
+        self.states = self.states[:, np.frombuffer(perm, dtype=np.uint8)]
+
+    def rotate_sequence(self, rotations):
+        self.states = self.states[:, np.frombuffer(compile_sequence(rotations).permutation, dtype=np.uint8)]
+
+    def rotate_rows(self, moves):
+        # per row moves: shape (N,) or (N, k) of move ids / tokens, columns are applied left to right
+        moves = np.asarray(moves)
+        if moves.dtype.kind in 'US':
+            moves = self.move_ids(moves.astype(str).ravel()).reshape(moves.shape)
+        if moves.ndim == 1:
+            moves = moves[:, None]
+        if len(moves) != len(self.states):
+            raise ValueError(f'expected {len(self.states)} rows of moves, got {len(moves)}')
+        table = CubeBatch.move_table()
+        for column in moves.T:
+            self.states = np.take_along_axis(self.states, table[column], axis=1)
+
+    def is_solved(self):
+        return (self.states == CubeBatch.solved_row()).all(axis=1)
+
+    def faces_solved(self):
+        # (N, 6) mask, columns in CubeData.Faces order
+        return (self.states.reshape(-1, 6, 9) == CubeBatch.solved_row().reshape(6, 9)).all(axis=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='cube.py')
+    commands = parser.add_subparsers(dest='command', required=True)
+    tables_parser = commands.add_parser('tables', help='generate the solver move / pruning table file')
+    tables_parser.add_argument('path', nargs='?', help='output file (default: $CUBE_SOLVING_TABLES or solver_tables.bin)')
+    for name, help_text in [('solve-batch', 'solve one state or move sequence per line'),
+                            ('scramble-batch', 'print the state for one state or move sequence per line')]:
+        batch_parser = commands.add_parser(name, help=help_text)
+        batch_parser.add_argument('input', nargs='?', default='-', help='input file, may be gzipped (default: stdin)')
+        batch_parser.add_argument('-o', '--output', default='-', help='output file, gzipped if it ends in .gz (default: stdout)')
+        batch_parser.add_argument('-j', '--workers', type=int, default=None, help='worker processes (default: cpu count)')
+        batch_parser.add_argument('--chunk-size', type=int, default=None, help='lines sent to a worker at a time')
+        if name == 'solve-batch':
+            batch_parser.add_argument('--max-length', type=int, default=21)
+            batch_parser.add_argument('--timeout', type=float, default=10.0, help='seconds per cube')
+            batch_parser.add_argument('--cache-size', type=int, default=0, help='solutions kept per worker for symmetric duplicates (default: off)')
+        else:
+            batch_parser.add_argument('--facelets', action='store_true', help='print 54 character facelet strings')
+    scramble_parser = commands.add_parser('scramble', help='print uniformly random solvable states')
+    scramble_parser.add_argument('-n', '--count', type=int, default=1)
+    scramble_parser.add_argument('-o', '--output', default='-', help='output file, gzipped if it ends in .gz (default: stdout)')
+    scramble_parser.add_argument('--seed', type=int, default=None, help='seed for a reproducible run (default: random)')
+    scramble_parser.add_argument('--worker', type=int, default=None, help='use the k-th independent stream of the seed, one per parallel worker')
+    scramble_parser.add_argument('--facelets', action='store_true', help='print 54 character facelet strings')
+    scramble_parser.add_argument('--solve', action='store_true', help='add a turn sequence from solved to each state, found with the solver')
+    scramble_parser.add_argument('--max-length', type=int, default=21)
+    scramble_parser.add_argument('--timeout', type=float, default=10.0, help='seconds per state with --solve')
+    convert_parser = commands.add_parser('convert', help='convert between facelet lines and packed cube records')
+    convert_parser.add_argument('input', help='facelet or record file, may be gzipped, - for stdin')
+    convert_parser.add_argument('output', help='output file, gzipped if it ends in .gz, - for stdout')
+    convert_parser.add_argument('--records', action='store_true', help='write packed records instead of facelet lines')
+    explore_parser = commands.add_parser('explore', help='breadth first search of the positions a set of turns reaches')
+    explore_parser.add_argument('moves', nargs='*', help='turns generating the group, e.g. R U (default: the face turns)')
+    explore_parser.add_argument('--depth', type=int, default=None, help='levels to explore (default: all)')
+    explore_parser.add_argument('--memory', type=int, default=256, help='MB of keys held in memory before spilling to disk')
+    explore_parser.add_argument('--directory', default=None, help='directory for spilled runs (default: system temp)')
+    explore_parser.add_argument('--table', metavar='COORDINATE', help='write the distance table of a solver coordinate, e.g. twist')
+    explore_parser.add_argument('-o', '--output', help='table file for --table')
+    serve_parser = commands.add_parser('serve', help='local HTTP server for validity, solved status and solutions')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8080)
+    serve_parser.add_argument('--batch-size', type=int, default=64, help='most queries per engine call')
+    serve_parser.add_argument('--batch-delay', type=float, default=2.0, help='ms to wait for more queries after the first')
+    serve_parser.add_argument('--cache-size', type=int, default=65536, help='results kept in the LRU cache')
+    serve_parser.add_argument('--max-length', type=int, default=21)
+    serve_parser.add_argument('--timeout', type=float, default=10.0, help='most seconds per solve')
+    load_parser = commands.add_parser('load-test', help='send requests to a running server, results as JSON')
+    load_parser.add_argument('--host', default='127.0.0.1')
+    load_parser.add_argument('--port', type=int, default=8080)
+    load_parser.add_argument('-n', '--requests', type=int, default=1000)
+    load_parser.add_argument('-c', '--concurrency', type=int, default=32, help='open connections')
+    load_parser.add_argument('--solve', action='store_true', help='ask for solutions instead of validity only')
+    load_parser.add_argument('--distinct', type=int, default=100, help='different random states to cycle through')
+    load_parser.add_argument('--seed', type=int, default=0)
+    check_parser = commands.add_parser('check', help='solve seeded random states and replay each solution')
+    check_parser.add_argument('--count', type=int, default=20, help='states to solve')
+    check_parser.add_argument('--seed', type=int, default=0)
+    check_parser.add_argument('--max-length', type=int, default=21)
+    check_parser.add_argument('--timeout', type=float, default=10.0, help='seconds per state')
+    bench_parser = commands.add_parser('bench', help='time moves, construction, is_solved, rendering and solving, results as JSON')
+    bench_parser.add_argument('-o', '--output', default='-', help='JSON output file (default: stdout)')
+    bench_parser.add_argument('--compare', metavar='BASELINE', help='earlier JSON result to report new / old ratios against')
+    bench_parser.add_argument('--repeat', type=int, default=3, help='timed runs per measurement, the best is kept')
+    bench_parser.add_argument('--min-time', type=float, default=0.05, help='seconds per timed run')
+    bench_parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == 'tables':
+        import solver
+        start = time.perf_counter()
+        path = solver.SolverTables.save(args.path)
+        print(f'wrote {path} in {time.perf_counter() - start:.1f}s')
+    elif args.command in ['solve-batch', 'scramble-batch']:
+        import batch
+        import cubeio
+        source, source_owned = cubeio.open_input(args.input)
+        target, target_owned = cubeio.open_output(args.output)
+        lines = (line.decode('ascii', 'replace') for line in source)
+        options = {'workers': args.workers}
+        if args.chunk_size is not None:
+            options['chunksize'] = args.chunk_size
+        if args.command == 'solve-batch':
+            results = batch.solve_batch(lines, max_length=args.max_length, timeout=args.timeout, cache_size=args.cache_size, **options)
+        else:
+            results = batch.scramble_batch(lines, facelets=args.facelets, **options)
+        try:
+            for result in results:
+                target.write(f'{result}\n'.encode())
+        finally:
+            if source_owned:
+                source.close()
+            if target_owned:
+                target.close()
+            else:
+                target.flush()
+    elif args.command == 'scramble':
+        import cubeio
+        import scramble
+        target, target_owned = cubeio.open_output(args.output)
+        try:
+            generator = scramble.generate(target, args.count, seed=args.seed, worker=args.worker, facelets=args.facelets,
+                                          solve=args.solve, max_length=args.max_length, timeout=args.timeout)
+        finally:
+            if target_owned:
+                target.close()
+            else:
+                target.flush()
+        print(f'seed {generator.seed}', file=sys.stderr)
+    elif args.command == 'convert':
+        import cubeio
+        write = cubeio.write_records if args.records else cubeio.write_facelets
+        try:
+            count = write(args.output, cubeio.read_states(args.input))
+        except ValueError as error:
+            print(f'error: {error}', file=sys.stderr)
+            return 1
+        print(f'converted {count} cubes', file=sys.stderr)
+    elif args.command == 'explore':
+        import json
+        import explore
+        import tables
+
+        def progress(stats):
+            print(f'depth {stats["depth"]}: {stats["level_sizes"][-1]} states, {stats["states"]} total, '
+                  f'{stats["states_per_sec"]:.0f} states/s, {stats["bytes_per_state"]} bytes/state', file=sys.stderr)
+
+        if args.table is not None and args.output is None:
+            parser.error('--table needs --output')
+        try:
+            explorer = explore.Explorer(args.moves, memory=args.memory << 20, directory=args.directory, progress=progress)
+            if args.table is not None:
+                size, coordinate = explore.solver_coordinate(args.table, explorer.moves)
+                table = explorer.distance_table(coordinate, size, args.depth)
+                import solver
+                tables.write_tables(args.output, {f'{args.table}_distance': table}, solver.SolverTables.Version)
+            else:
+                explorer.run(args.depth)
+        except ValueError as error:
+            print(f'error: {error}', file=sys.stderr)
+            return 1
+        print(json.dumps(explorer.stats()))
+        explorer.close()
+    elif args.command == 'serve':
+        import server
+        server.serve(args.host, args.port, batch_size=args.batch_size, batch_delay=args.batch_delay / 1000, cache_size=args.cache_size,
+                     max_length=args.max_length, timeout=args.timeout)
+    elif args.command == 'load-test':
+        import asyncio
+        import json
+        import scramble
+        import server
+        generator = scramble.ScrambleGenerator(args.seed)
+        queries = [{'state': generator.configuration()} for _ in range(args.distinct)]
+        try:
+            results = asyncio.run(server.load_test(args.host, args.port, queries, args.requests, args.concurrency, '/solve' if args.solve else '/check'))
+        except OSError as error:
+            print(f'error: {error}', file=sys.stderr)
+            return 1
+        print(json.dumps(results, indent=2))
+    elif args.command == 'check':
+        import scramble
+        import solver
+        generator = scramble.ScrambleGenerator(args.seed)
+        try:
+            results = solver.check_solutions([generator.state() for _ in range(args.count)], args.max_length, args.timeout)
+        except ValueError as error:
+            print(f'error: {error}', file=sys.stderr)
+            return 1
+        found = [moves for moves, seconds in results if moves is not None]
+        print(f'{len(found)} of {len(results)} solved and replayed, longest {max(map(len, found), default=0)} turns, '
+              f'{max(seconds for moves, seconds in results):.3f}s slowest')
+        return 0 if len(found) == len(results) else 1
+    elif args.command == 'bench':
+        import bench
+        bench.main(args.output, baseline=args.compare, repeat=args.repeat, min_time=args.min_time, seed=args.seed)
+    return 0
+
+
+if __name__ == '__main__' and len(sys.argv) > 1:
+    sys.exit(main())
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG, format='%(message)s')
+
     # # test all rotations
     # cube = Cube()
     # cube.toggle_debug()
@@ -449,20 +1579,4 @@ if __name__ == '__main__':
     print(repr(cube))
 
 
-    # # random turns timing test
-    # start = datetime.datetime.now()
-    # cube = Cube()
-    # rotations = 'RLUDFBrludfbMES'
-    # choices = []
-    # for turn in rotations:
-    #     choices.append(f'{turn}')
-    #     choices.append(f'2{turn}')
-    #     choices.append(f'3{turn}')
-    #     choices.append(f'{turn}i')
-    #     choices.append(f'2{turn}i')
-    #     choices.append(f'3{turn}i')
-
-    # for choice in random.choices(choices, k=200):
-    #     exec(f'cube.rotate(\'{choice}\')')
-    # print(cube)
-    # print(datetime.datetime.now() - start)
+    # # timing: python cube.py bench -o before.json, then python cube.py bench --compare before.json
@@ -0,0 +1,187 @@
+#! /usr/bin/env python3
+
+import gzip
+import io
+import sys
+
+from cube import Cube, CubeData
+
+# binary record stream: Record_Magic header, then one Record_Size record per cube
+#   8 corner bytes  piece * 3 + orientation, in CubeData.Corner_Squares slot order
+#   12 edge bytes   piece * 2 + orientation, in CubeData.Edge_Squares slot order
+#   1 center byte   index into CubeData.Center_Orientations
+Record_Magic = b'CUBEREC1'
+Record_Size = 21
+Gzip_Magic = b'\x1f\x8b'
+
+
+def open_input(path):
+    # binary input stream and whether the caller owns it; path may be a file name, '-' for stdin or an
+    # already open binary file; gzip is detected from the magic bytes, so gzipped stdin works too
+    if path == '-':
+        stream, owned = sys.stdin.buffer, False
+    elif isinstance(path, str):
+        stream, owned = open(path, 'rb'), True
+    else:
+        stream, owned = path, False
+    if not hasattr(stream, 'peek'):
+        stream = io.BufferedReader(stream)
+    if stream.peek(2)[:2] == Gzip_Magic:
+        if owned:
+            stream.close()
+            stream = gzip.open(path, 'rb')
+        else:
+            stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    return stream, owned
+
+
+def open_output(path):
+    # binary output stream and whether the caller owns it; names ending in .gz are gzip compressed
+    if path == '-':
+        sys.stdout.flush()
+        return sys.stdout.buffer, False
+    if isinstance(path, str):
+        return (gzip.open(path, 'wb') if path.endswith('.gz') else open(path, 'wb')), True
+    return path, False
+
+
+def _close(stream, owned, output=False):
+    if owned:
+        stream.close()
+    elif output:
+        stream.flush()
+
+
+def _states(cubes):
+    for cube in cubes:
+        yield bytes(cube.state) if isinstance(cube, Cube) else bytes(cube)
+
+
+def state_to_facelets(state):
+    return ''.join(CubeData.Sticker_Colors[sticker] for sticker in state)
+
+
+def facelets_to_state(facelets):
+    try:
+        return CubeData.decode_configuration(facelets)
+    except ValueError as error:
+        raise ValueError(f'invalid facelet string {facelets!r}: {error}')
+
+
+def encode_record(state):
+    record = bytearray(Record_Size)
+    try:
+        for slot, facelets in enumerate(CubeData.Corner_Stickers):
+            piece, orientation = CubeData.Corner_Sticker[state[facelets[0]]]
+            record[slot] = piece * 3 + orientation
+        for slot, facelets in enumerate(CubeData.Edge_Stickers):
+            piece, orientation = CubeData.Edge_Sticker[state[facelets[0]]]
+            record[8 + slot] = piece * 2 + orientation
+        record[20] = CubeData.Center_Orientation_Index[bytes(state[i] for i in CubeData.Center_Stickers)]
+    except KeyError:
+        raise ValueError('state has no piece encoding')
+    return bytes(record)
+
+
+def decode_record(record):
+    if len(record) != Record_Size or max(record[:20]) >= 24 or record[20] >= len(CubeData.Center_Orientations):
+        raise ValueError('invalid cube record')
+    corners, edges = [value // 3 for value in record[:8]], [value // 2 for value in record[8:20]]
+    if len(set(corners)) != 8 or len(set(edges)) != 12:
+        raise ValueError('invalid cube record')
+    # the same solvability checks as CubeData.decode_configuration
+    if sum(value % 3 for value in record[:8]) % 3 != 0:
+        raise ValueError('invalid cube record: twisted corner')
+    if sum(value % 2 for value in record[8:20]) % 2 != 0:
+        raise ValueError('invalid cube record: flipped edge')
+    if CubeData.parity(corners) ^ CubeData.parity(edges) != CubeData.Center_Parities[record[20]]:
+        raise ValueError('invalid cube record: permutation parity')
+    state = bytearray(54)
+    for slot, facelets in enumerate(CubeData.Corner_Stickers):
+        piece, orientation = divmod(record[slot], 3)
+        for k, facelet in enumerate(facelets):
+            state[facelet] = CubeData.Corner_Stickers[piece][(orientation + k) % 3]
+    for slot, facelets in enumerate(CubeData.Edge_Stickers):
+        piece, orientation = divmod(record[8 + slot], 2)
+        for k, facelet in enumerate(facelets):
+            state[facelet] = CubeData.Edge_Stickers[piece][(orientation + k) % 2]
+    for facelet, center in zip(CubeData.Center_Stickers, CubeData.Center_Orientations[record[20]]):
+        state[facelet] = center
+    return bytes(state)
+
+
+def read_facelets(path):
+    # yields sticker states, one 54 character facelet line at a time; blank and '#' lines are skipped
+    stream, owned = open_input(path)
+    try:
+        yield from _read_facelet_lines(stream)
+    finally:
+        _close(stream, owned)
+
+
+def _read_facelet_lines(stream):
+    for number, line in enumerate(stream, 1):
+        line = line.strip().decode('ascii', 'replace')
+        if not line or line.startswith('#'):
+            continue
+        try:
+            yield facelets_to_state(line)
+        except ValueError as error:
+            raise ValueError(f'line {number}: {error}')
+
+
+def write_facelets(path, cubes):
+    stream, owned = open_output(path)
+    count = 0
+    try:
+        for state in _states(cubes):
+            stream.write(state_to_facelets(state).encode() + b'\n')
+            count += 1
+    finally:
+        _close(stream, owned, output=True)
+    return count
+
+
+def read_records(path):
+    stream, owned = open_input(path)
+    try:
+        yield from _read_record_stream(stream)
+    finally:
+        _close(stream, owned)
+
+
+def _read_record_stream(stream):
+    if stream.read(len(Record_Magic)) != Record_Magic:
+        raise ValueError('not a cube record stream')
+    while True:
+        record = stream.read(Record_Size)
+        if not record:
+            return
+        if len(record) != Record_Size:
+            raise ValueError('truncated cube record')
+        yield decode_record(record)
+
+
+def write_records(path, cubes):
+    stream, owned = open_output(path)
+    count = 0
+    try:
+        stream.write(Record_Magic)
+        for state in _states(cubes):
+            stream.write(encode_record(state))
+            count += 1
+    finally:
+        _close(stream, owned, output=True)
+    return count
+
+
+def read_states(path):
+    # either format, told apart by the record header
+    stream, owned = open_input(path)
+    try:
+        if stream.peek(len(Record_Magic))[:len(Record_Magic)] == Record_Magic:
+            yield from _read_record_stream(stream)
+        else:
+            yield from _read_facelet_lines(stream)
+    finally:
+        _close(stream, owned)
@@ -0,0 +1,307 @@
+#! /usr/bin/env python3
+
+import heapq
+import os
+import sys
+import tempfile
+import time
+
+from cube import CubeData
+
+# a state is stored as a fixed width key: the sticker on the reference square (first square) of every corner and
+# edge slot, which names the piece and its orientation, plus the six centers when the moves can move them; the
+# other squares of a slot follow from the reference sticker through Next_Sticker
+Reference_Squares = [stickers[0] for stickers in CubeData.Corner_Stickers + CubeData.Edge_Stickers]
+Next_Sticker = [bytearray(256), bytearray(256)]
+for _pieces in [CubeData.Corner_Stickers, CubeData.Edge_Stickers]:
+    for _stickers in _pieces:
+        for _j, _sticker in enumerate(_stickers):
+            Next_Sticker[0][_sticker] = _stickers[(_j + 1) % len(_stickers)]
+            Next_Sticker[1][_sticker] = _stickers[(_j + 2) % len(_stickers)]
+for _sticker in CubeData.Center_Stickers:
+    Next_Sticker[0][_sticker] = Next_Sticker[1][_sticker] = _sticker
+Next_Sticker = [bytes(table) for table in Next_Sticker]
+
+
+def expand_moves(moves):
+    # a turn letter stands for its quarter, half and inverse turns; a token also brings its inverse, so the move
+    # set is closed under inverses and a level's neighbours can only be in the levels next to it
+    tokens = []
+    for move in moves:
+        if move in CubeData.Turns:
+            candidates = [move, f'2{move}', f'{move}i']
+        else:
+            perm = CubeData.turn_permutation(move)
+            if perm is None:
+                raise ValueError(f'Invalid Rotation: {move}')
+            inverse = bytearray(54)
+            for i, j in enumerate(perm):
+                inverse[j] = i
+            candidates = [move, next(token for token, other in CubeData.Turn_Permutations.items() if other == inverse)]
+        for token in candidates:
+            if CubeData.turn_permutation(token) is None:
+                raise ValueError(f'Invalid Rotation: {token}')
+            if CubeData.turn_permutation(token) not in [CubeData.turn_permutation(other) for other in tokens]:
+                tokens.append(token)
+    return tokens
+
+
+class Run:
+    # sorted fixed width keys, held in memory or in a file once they outgrow the memory budget
+    def __init__(self, width, data=b'', path=None, count=0):
+        self.width = width
+        self.data = data
+        self.path = path
+        self.count = count if path is not None else len(data) // width
+
+    def __len__(self):
+        return self.count
+
+    def nbytes(self):
+        return self.count * self.width
+
+    def records(self, block=4096):
+        if self.path is None:
+            data, width = self.data, self.width
+            for offset in range(0, len(data), width):
+                yield data[offset:offset + width]
+            return
+        # unbuffered: the reads are already block keys long, and many runs may be open at once
+        with open(self.path, 'rb', buffering=0) as handle:
+            while True:
+                data = handle.read(self.width * block)
+                if not data:
+                    return
+                for offset in range(0, len(data), self.width):
+                    yield data[offset:offset + self.width]
+
+    def remove(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class RunWriter:
+    # collects keys in sorted order into one buffer (width bytes a key, no per key objects), switching from memory
+    # to a temporary file past limit bytes (written block bytes at a time from then on)
+    def __init__(self, width, limit, directory=None, block=1 << 20):
+        self.width = width
+        self.limit = limit
+        self.directory = directory
+        self.block = block
+        self.buffer = bytearray()
+        self.count = 0
+        self.handle = None
+        self.path = None
+
+    def write(self, key):
+        self.buffer += key
+        self.count += 1
+        if len(self.buffer) >= (self.limit if self.handle is None else self.block):
+            self.flush()
+
+    def flush(self):
+        if self.handle is None:
+            descriptor, self.path = tempfile.mkstemp(prefix='explore-', suffix='.run', dir=self.directory)
+            self.handle = os.fdopen(descriptor, 'wb')
+        self.handle.write(self.buffer)
+        self.buffer = bytearray()
+
+    def close(self):
+        if self.handle is None:
+            return Run(self.width, bytes(self.buffer))
+        self.flush()
+        self.handle.close()
+        return Run(self.width, path=self.path, count=self.count)
+
+
+def _unique(records):
+    previous = None
+    for record in records:
+        if record != previous:
+            yield record
+            previous = record
+
+
+def _difference(records, *excluded):
+    # sorted records minus the records of the sorted excluded streams
+    excluded = _unique(heapq.merge(*excluded))
+    skip = next(excluded, None)
+    for record in records:
+        while skip is not None and skip < record:
+            skip = next(excluded, None)
+        if record != skip:
+            yield record
+
+
+class Explorer:
+    # frontier by frontier breadth first search over the group generated by moves, from start (solved by default);
+    # only the last two levels are needed to drop duplicates, because every move's inverse is also a move
+    def __init__(self, moves=None, memory=256 << 20, directory=None, progress=None, start=None):
+        self.moves = expand_moves(moves or CubeData.Faces)
+        self.memory = memory
+        self.directory = directory
+        self.progress = progress
+        self.start = bytes(CubeData.Solved_State if start is None else start)
+        permutations = [CubeData.turn_permutation(move) for move in self.moves]
+        centers = any(perm[i] != i for perm in permutations for i in CubeData.Center_Stickers)
+        self.reference = bytes(Reference_Squares + (CubeData.Center_Stickers if centers else []))
+        self.width = len(self.reference)
+        # key of a turned state straight from the state: the reference squares read through the turn
+        self.move_references = [bytes(perm[i] for i in self.reference) for perm in permutations]
+        # state from a key: the reference stickers, then the next and the one after in each piece, scattered
+        # (centers that cannot move are taken from start)
+        scatter = bytearray(54)
+        for slot, stickers in enumerate(CubeData.Corner_Stickers + CubeData.Edge_Stickers):
+            for j, square in enumerate(stickers):
+                scatter[square] = j * self.width + slot
+        for k, square in enumerate(CubeData.Center_Stickers):
+            scatter[square] = 20 + k if centers else 3 * self.width + k
+        self.scatter = bytes(scatter)
+        self.table_padding = (b'' if centers else bytes(self.start[i] for i in CubeData.Center_Stickers))
+        self.table_padding += bytes(256 - 3 * self.width - len(self.table_padding))
+        self.levels = []
+        self.level_sizes = []
+        self.depth = -1
+        self.states = 0
+        self.expanded = 0
+        self.spilled_runs = 0
+        self.elapsed = 0.0
+
+    def key(self, state):
+        return self.reference.translate(bytes(state) + CubeData.Translate_Padding)
+
+    def state(self, key):
+        return self.scatter.translate(key + key.translate(Next_Sticker[0]) + key.translate(Next_Sticker[1]) + self.table_padding)
+
+    def entry_size(self):
+        # candidate cost per key: the bytes object (rounded to the allocator's 8 bytes), its pointer in the sorted
+        # copy and its share of the set's table, 16 byte slots that a set growing 4x at a time spreads up to 8 per
+        # key right after it grows
+        return -(-sys.getsizeof(bytes(self.width)) // 8) * 8 + 8 + 8 * 16
+
+    def block(self, streams=1):
+        # keys per buffered read or write when streams files are open at once, so their buffers together stay
+        # within a sixteenth of the budget
+        return max(self.memory // 16 // max(streams, 1) // self.width, 1)
+
+    def stats(self):
+        stored = sum(level.nbytes() for level in self.levels[-2:])
+        kept = sum(len(level) for level in self.levels[-2:])
+        return {
+            'moves': self.moves,
+            'depth': self.depth,
+            'level_sizes': self.level_sizes,
+            'states': self.states,
+            'expanded': self.expanded,
+            'elapsed': round(self.elapsed, 3),
+            'states_per_sec': round(self.states / self.elapsed, 1) if self.elapsed else 0.0,
+            'key_bytes': self.width,
+            'bytes_per_state': round(stored / kept, 1) if kept else 0.0,
+            'spilled_runs': self.spilled_runs,
+        }
+
+    def run(self, depth=None, visit=None):
+        # explores up to depth levels (all of them when None); visit(depth, state) sees every new state once
+        started = time.perf_counter() - self.elapsed
+        if self.depth < 0:
+            self.levels = [Run(self.width, self.key(self.start))]
+            self.level_sizes = [1]
+            self.depth = 0
+            self.states = 1
+            if visit is not None:
+                visit(0, self.start)
+        while (depth is None or self.depth < depth) and len(self.levels[-1]):
+            level = self.expand(self.levels[-1], self.levels[-2] if len(self.levels) > 1 else Run(self.width), started)
+            self.depth += 1
+            self.states += len(level)
+            self.level_sizes.append(len(level))
+            if visit is not None:
+                for key in level.records():
+                    visit(self.depth, self.state(key))
+            if len(self.levels) > 1:
+                self.levels.pop(0).remove()
+            self.levels.append(level)
+            self.elapsed = time.perf_counter() - started
+            if self.progress is not None:
+                self.progress(self.stats())
+        self.elapsed = time.perf_counter() - started
+        return self.level_sizes
+
+    def expand(self, current, previous, started):
+        # one budget for everything held at once: the two levels kept in memory (each written with an eighth of
+        # it), the level being written (an eighth, twice over while it is joined), file buffers (a sixteenth)
+        # and the candidates, which get the rest
+        held = sum(level.nbytes() for level in (current, previous) if level.path is None)
+        limit = max((self.memory - held - self.memory // 4 - self.memory // 16) // self.entry_size(), 1)
+        runs, candidates = [], set()
+        move_references, padding = self.move_references, CubeData.Translate_Padding
+        for key in current.records(self.block(2)):
+            state = self.state(key) + padding
+            for reference in move_references:
+                candidates.add(reference.translate(state))
+            self.expanded += 1
+            if len(candidates) >= limit:
+                runs.append(self.spill(candidates))
+                candidates = set()
+            if self.progress is not None and self.expanded % 100000 == 0:
+                self.elapsed = time.perf_counter() - started
+                self.progress(self.stats())
+        if runs:
+            runs.append(self.spill(candidates))
+            block = self.block(len(runs) + 3)
+            merged = _unique(heapq.merge(*[run.records(block) for run in runs]))
+        else:
+            block = self.block(3)
+            merged = sorted(candidates)
+            candidates = None
+        writer = RunWriter(self.width, self.memory // 8, self.directory, block * self.width)
+        for key in _difference(merged, current.records(block), previous.records(block)):
+            writer.write(key)
+        level = writer.close()
+        if writer.handle is not None:
+            # the level itself outgrew memory and went to disk
+            self.spilled_runs += 1
+        for run in runs:
+            run.remove()
+        return level
+
+    def spill(self, candidates):
+        writer = RunWriter(self.width, 0, self.directory, self.block(2) * self.width)
+        for key in sorted(candidates):
+            writer.write(key)
+        self.spilled_runs += 1
+        return writer.close()
+
+    def close(self):
+        for level in self.levels:
+            level.remove()
+        self.levels = []
+
+    def distance_table(self, coordinate, size, depth=None):
+        # exact distances of a coordinate (state -> 0 .. size - 1) in the explored group, 0xff where not reached
+        # within depth; the same layout as the solver's pruning tables
+        table = bytearray(b'\xff' * size)
+
+        def visit(distance, state):
+            index = coordinate(state)
+            if table[index] == 0xff:
+                table[index] = distance
+
+        self.run(depth, visit)
+        return table
+
+
+def solver_coordinate(name, moves):
+    # (size, state -> value) for one of the solver's move table coordinates (twist, flip, slice, corner_perm,
+    # edge_perm, slice_perm), for distance_table over an explorer turning moves; the centers must be home, and the
+    # phase 2 coordinates are only defined in <U, D, R2, L2, F2, B2>, so other moves are rejected for them
+    from solver import CubieCube, SolverData, SolverTables
+    if f'{name}_move' not in SolverTables.Move_Tables:
+        raise ValueError(f'unknown coordinate {name}')
+    size, phase2, _, getter, _ = SolverTables.Move_Tables[f'{name}_move']
+    if phase2:
+        allowed = set(CubeData.turn_permutation(SolverData.Moves[i]) for i in SolverData.Phase2_Moves)
+        outside = [move for move in expand_moves(moves) if CubeData.turn_permutation(move) not in allowed]
+        if outside:
+            raise ValueError(f'{name} needs moves in <U, D, R2, L2, F2, B2>, not {" ".join(outside)}')
+    return size, lambda state: getter(CubieCube.from_state(state))
@@ -0,0 +1,203 @@
+#! /usr/bin/env python3
+
+import hashlib
+import itertools
+import random
+
+from cube import Cube, CubeBatch, CubeData, import_numpy
+
+# uniformly random solvable states, sampled directly instead of by random turns: a random corner and edge
+# permutation with matching parity, random twist and flip summing to 0, centers home
+Seed_Bits = 128
+
+
+def invert_moves(moves):
+    # turns undoing moves: reversed, each one inverted
+    return [move[:-1] if move.endswith('i') else (move if move[0] == '2' else f'{move}i') for move in reversed(moves)]
+
+
+def scramble_moves(state, max_length=21, timeout=10.0):
+    # turns taking the solved cube to state: a solution, undone; None if the solver finds none in time
+    import solver
+    moves = solver.solve(Cube.from_state(state), max_length=max_length, timeout=timeout)
+    return None if moves is None else invert_moves(moves)
+
+
+class ScrambleGenerator:
+    # seed and stream name the random stream; spawn() hands out child streams (stream + (k,)) that never share
+    # seed material with their parent, their siblings or any other stream, so parallel workers given
+    # spawn(workers) produce independent states and the same seed always reproduces the same states
+    def __init__(self, seed=None, stream=()):
+        self.seed = random.SystemRandom().getrandbits(Seed_Bits) if seed is None else seed
+        self.stream = tuple(stream)
+        self.spawned = 0
+        material = hashlib.sha256(repr((self.seed, self.stream)).encode()).digest()
+        self.random = random.Random(int.from_bytes(material, 'little'))
+        self.generator = None
+
+    def __repr__(self):
+        return f'ScrambleGenerator(seed={self.seed!r}, stream={self.stream!r})'
+
+    def spawn(self, count):
+        children = [ScrambleGenerator(self.seed, self.stream + (self.spawned + k,)) for k in range(count)]
+        self.spawned += count
+        return children
+
+    def numpy_generator(self):
+        # PCG64 over numpy's SeedSequence, whose spawn_key plays the part of stream
+        if self.generator is None:
+            np = import_numpy()
+            if np is None:
+                raise ImportError('batch scrambles require numpy')
+            entropy = self.seed if isinstance(self.seed, int) and self.seed >= 0 else int.from_bytes(hashlib.sha256(repr(self.seed).encode()).digest(), 'little')
+            self.generator = np.random.Generator(np.random.PCG64(np.random.SeedSequence(entropy, spawn_key=self.stream)))
+        return self.generator
+
+    def state(self):
+        rng = self.random
+        corners, edges = list(range(8)), list(range(12))
+        rng.shuffle(corners)
+        rng.shuffle(edges)
+        # swapping two edges pairs every odd permutation with one even one, so fixing parity keeps it uniform
+        if CubeData.parity(corners) != CubeData.parity(edges):
+            edges[10], edges[11] = edges[11], edges[10]
+        twist = [rng.randrange(3) for _ in range(7)]
+        flip = [rng.randrange(2) for _ in range(11)]
+        twist.append(-sum(twist) % 3)
+        flip.append(sum(flip) % 2)
+        state = bytearray(CubeData.Solved_State)
+        for stickers, piece, orientation in zip(CubeData.Corner_Stickers, corners, twist):
+            for square, sticker in zip(stickers, CubeData.Corner_Orientations[piece][orientation]):
+                state[square] = sticker
+        for stickers, piece, orientation in zip(CubeData.Edge_Stickers, edges, flip):
+            for square, sticker in zip(stickers, CubeData.Edge_Orientations[piece][orientation]):
+                state[square] = sticker
+        return bytes(state)
+
+    def cube(self):
+        return Cube.from_state(self.state())
+
+    def configuration(self):
+        return self.cube().to_configuration()
+
+    def scramble(self, max_length=21, timeout=10.0):
+        # (configuration, turns from solved to it), the turns None if the solver finds no solution in time
+        state = self.state()
+        return Cube.from_state(state).to_configuration(), scramble_moves(state, max_length, timeout)
+
+    @staticmethod
+    def tables():
+        # every corner permutation, every ordered six of edges (one of the 924 splits of the edges in two sixes, in
+        # one of the permutations of six, odd ones after the even ones) for each half, every twist and flip summing
+        # to 0; each row holds the slot codes of a state's pieces packed in a uint64 (a byte per slot, padded to
+        # 8), so a batch is one 1-d gather per table and the codes of a slot add without carrying into the next;
+        # the two ordered-six tables (924 * 720 rows) take about 5 MB each
+        if not hasattr(ScrambleGenerator, '_Tables'):
+            np = import_numpy()
+
+            def packed(rows):
+                rows = np.array(rows, dtype=np.uint8)
+                padded = np.zeros((len(rows), 8), dtype=np.uint8)
+                padded[:, :rows.shape[1]] = rows
+                return padded.view(np.uint64).ravel()
+
+            corner_perms = list(itertools.permutations(range(8)))
+            halves = [list(first) + [edge for edge in range(12) if edge not in first] for first in itertools.combinations(range(12), 6)]
+            six_perms = sorted(itertools.permutations(range(6)), key=CubeData.parity)
+            twists = [twist + (-sum(twist) % 3,) for twist in itertools.product(range(3), repeat=7)]
+            flips = np.array([flip + (sum(flip) % 2,) for flip in itertools.product(range(2), repeat=11)], dtype=np.uint8)
+            # slot codes: piece * 9 + twist * 3 for corners, 72 + piece * 6 + flip * 3 for edges, 144 + center * 3
+            # for centers; a square's sticker is then square_values[code + its index within the slot]
+            split_halves, orders = np.array(halves, dtype=np.uint8)[:, None, :], np.array(six_perms, dtype=np.uint8)[None, :, :]
+            ordered = [np.take_along_axis(split_halves[:, :, half:half + 6], orders, axis=2).reshape(-1, 6) * 6 + 72 for half in (0, 6)]
+            values = bytearray(256)
+            for offset, size, pieces in [(0, 9, CubeData.Corner_Orientations), (72, 6, CubeData.Edge_Orientations)]:
+                for piece, orientations in enumerate(pieces):
+                    for orientation, stickers in enumerate(orientations):
+                        values[offset + piece * size + orientation * 3:offset + piece * size + orientation * 3 + len(stickers)] = stickers
+            for center, sticker in enumerate(CubeData.Center_Stickers):
+                values[144 + center * 3] = sticker
+            # the byte of each square's slot within a row of four packed codes, and the square's index in its slot
+            slots = CubeData.Corner_Stickers + CubeData.Edge_Stickers[:6] + [[]] * 2 + CubeData.Edge_Stickers[6:] + [[]] * 2 + [[center] for center in CubeData.Center_Stickers]
+            square_slots, square_offsets = [0] * 54, [0] * 54
+            for slot, stickers in enumerate(slots):
+                for k, square in enumerate(stickers):
+                    square_slots[square], square_offsets[square] = slot, k
+            ScrambleGenerator._Tables = {
+                'corner_codes': packed([[piece * 9 for piece in perm] for perm in corner_perms]),
+                'corner_parity': np.array([CubeData.parity(perm) for perm in corner_perms], dtype=np.uint16),
+                'half_parity': np.array([CubeData.parity(half) for half in halves], dtype=np.uint16),
+                'six_parity': np.array([CubeData.parity(perm) for perm in six_perms], dtype=np.uint16),
+                'first_codes': packed(ordered[0]),
+                'last_codes': packed(ordered[1]),
+                'twist_codes': packed([[orientation * 3 for orientation in twist] for twist in twists]),
+                'first_flip_codes': packed(flips[:, :6] * 3),
+                'last_flip_codes': packed(flips[:, 6:] * 3),
+                'center_codes': packed([[144 + center * 3 for center in range(6)]])[0],
+                'square_slots': np.array(square_slots, dtype=np.intp),
+                'square_offsets': np.array(square_offsets, dtype=np.uint8)[:, None],
+                'square_values': bytes(values)}
+        return ScrambleGenerator._Tables
+
+    def states(self, count):
+        # (count, 54) uint8 sticker states, uniform over the solvable cubes with the centers home
+        np = import_numpy()
+        rng, tables = self.numpy_generator(), ScrambleGenerator.tables()
+        corner_ranks = rng.integers(0, 40320, count, dtype=np.uint16)
+        splits, first, last = rng.integers(0, 924, count, dtype=np.uint16), rng.integers(0, 720, count, dtype=np.uint16), rng.integers(0, 360, count, dtype=np.uint16)
+        twist, flip = rng.integers(0, 2187, count, dtype=np.uint16), rng.integers(0, 2048, count, dtype=np.uint16)
+        # an edge permutation is a split into two sixes and an order for each; the second order is drawn from the
+        # 360 permutations whose parity matches the corners, which keeps it uniform
+        last += (tables['corner_parity'][corner_ranks] ^ tables['half_parity'][splits] ^ tables['six_parity'][first]) * np.uint16(360)
+        splits = splits.astype(np.uint32) * 720
+        codes = np.empty((count, 4), dtype=np.uint64)
+        codes[:, 0] = tables['corner_codes'][corner_ranks] + tables['twist_codes'][twist]
+        codes[:, 1] = tables['first_codes'][splits + first] + tables['first_flip_codes'][flip]
+        codes[:, 2] = tables['last_codes'][splits + last] + tables['last_flip_codes'][flip]
+        codes[:, 3] = tables['center_codes']
+        # every square's slot code in one gather, then its sticker in one translate
+        squares = codes.view(np.uint8).T[tables['square_slots']]
+        squares += tables['square_offsets']
+        return np.frombuffer(bytearray(squares.T.tobytes()).translate(tables['square_values']), dtype=np.uint8).reshape(count, 54)
+
+    def batch(self, count):
+        return CubeBatch(states=self.states(count))
+
+
+def format_states(states, facelets=False):
+    # one line per (N, 54) state row, as 54 facelets or the six 9-square strings of Cube(configuration), as bytes
+    np = import_numpy()
+    colors = np.frombuffer(CubeData.Sticker_Colors.encode(), dtype=np.uint8)[states]
+    if facelets:
+        lines = np.empty((len(states), 55), dtype=np.uint8)
+        lines[:, :54] = colors
+        lines[:, 54] = ord('\n')
+    else:
+        lines = np.full((len(states), 6, 10), ord(' '), dtype=np.uint8)
+        lines[:, :, :9] = colors.reshape(-1, 6, 9)
+        lines[:, 5, 9] = ord('\n')
+    return lines.tobytes()
+
+
+def generate(stream, count, seed=None, worker=None, facelets=False, solve=False, max_length=21, timeout=10.0, block=65536):
+    # writes count scrambles to a binary stream and returns the generator; worker k of a parallel run uses the
+    # child stream (k,) of seed; the states come from the batch path whenever numpy is there, so a seed gives the
+    # same states with or without solve
+    generator = ScrambleGenerator(seed, () if worker is None else (worker,))
+    batched = import_numpy() is not None
+    for start in range(0, count, block):
+        size = min(block, count - start)
+        if batched and not solve:
+            stream.write(format_states(generator.states(size), facelets))
+            continue
+        states = [bytes(row) for row in generator.states(size)] if batched else [generator.state() for _ in range(size)]
+        lines = []
+        for state in states:
+            configuration = Cube.from_state(state).to_configuration()
+            line = ''.join(configuration) if facelets else ' '.join(configuration)
+            if solve:
+                moves = scramble_moves(state, max_length, timeout)
+                line += '\t' + ('NONE' if moves is None else ' '.join(moves))
+            lines.append(f'{line}\n')
+        stream.write(''.join(lines).encode())
+    return generator
@@ -0,0 +1,319 @@
+#! /usr/bin/env python3
+
+import asyncio
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from batch import parse_line
+from cube import Cube, TranspositionCache
+
+# local HTTP/1.1 JSON service: the tables are loaded once, concurrent requests are gathered into batches that
+# run in one engine call on a worker thread, and results are kept in an LRU keyed by the decoded sticker state
+#   POST /check   {"state": six 9-square strings (list or one string) or 54 facelets, "moves": "R U Ri"}
+#                 -> {"valid", "solved", "state"} (moves are applied to state, or to the solved cube)
+#   POST /solve   the same, plus "max_length" / "timeout", -> also {"solution"} (null when none was found) and
+#                 {"within_max_length"} (false when it is null or longer than max_length)
+#   GET /metrics  request, batch, cache and latency numbers;  GET /health
+# a body may also be a JSON list of such objects, answered with a list
+Max_Body = 1 << 20
+Status_Text = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    # nearest rank percentiles of samples, in milliseconds
+    if not samples:
+        return dict((f'p{point}', None) for point in points)
+    ordered = sorted(samples)
+    return dict((f'p{point}', round(ordered[min(len(ordered) - 1, len(ordered) * point // 100)] * 1000, 3)) for point in points)
+
+
+class Engine:
+    # the batch step: parse, validate and solve a list of queries; runs on one thread, so the caches need no lock
+    def __init__(self, cache_size=65536, max_length=21, timeout=10.0):
+        self.max_length = max_length
+        self.timeout = timeout
+        self.results = TranspositionCache(cache_size)
+        # solutions shared between symmetric states, as in solve-batch
+        self.solutions = TranspositionCache(cache_size)
+
+    def warm_up(self):
+        import solver
+        tables = solver.SolverTables.get()
+        for name in solver.SolverTables.Table_Names:
+            getattr(tables, name)
+
+    @staticmethod
+    def line(query):
+        # the query as one parse_line input: a state, or a move sequence (after the state's own moves, if any)
+        if not isinstance(query, dict):
+            raise ValueError('query must be a JSON object')
+        state, moves = query.get('state'), query.get('moves')
+        if state is None and moves is None:
+            raise ValueError('query needs a state or moves')
+        if isinstance(state, list) and all(isinstance(face, str) for face in state):
+            state = ' '.join(state)
+        if isinstance(moves, list) and all(isinstance(move, str) for move in moves):
+            moves = ' '.join(moves)
+        if state is not None and not isinstance(state, str) or moves is not None and not isinstance(moves, str):
+            raise ValueError('state and moves must be strings or lists of strings')
+        return state, moves
+
+    def state(self, query):
+        state, moves = self.line(query)
+        if state is None:
+            return parse_line(moves)
+        state = parse_line(state)
+        if moves is not None:
+            cube = Cube.from_state(state)
+            cube.rotate_sequence(moves)
+            state = bytes(cube.state)
+        return state
+
+    def run(self, queries):
+        # queries: (query, solve) pairs -> result dicts, in order; a query that fails only fails its own result
+        results = []
+        for query, solve in queries:
+            try:
+                results.append(self.query(query, solve))
+            except ValueError as error:
+                results.append({'valid': False, 'error': str(error)})
+            except Exception as error:
+                results.append({'valid': False, 'error': f'internal error: {error!r}'})
+        return results
+
+    def query(self, query, solve):
+        state = self.state(query)
+        if solve:
+            max_length, timeout = self.limits(query)
+        result = self.results.get(state)
+        if result is None:
+            cube = Cube.from_state(state)
+            result = {'valid': True, 'solved': cube.is_solved(), 'state': cube.to_configuration()}
+            self.results.put(state, result)
+        if not solve:
+            return dict((key, value) for key, value in result.items() if key != 'solution')
+        # one search per state at most: a cached solution is returned as is, flagged when it is longer than this
+        # query allows (it was found for an earlier query allowing more turns); a failed search (timeout) is not cached
+        solution = result.get('solution')
+        if solution is None:
+            solution = self.solve(Cube.from_state(state), max_length, timeout)
+            if solution is not None:
+                self.results.put(state, dict(result, solution=solution))
+        return dict(result, solution=solution, within_max_length=solution is not None and len(solution) <= max_length)
+
+    def limits(self, query):
+        # (max_length, timeout) of a query, capped at the engine's own
+        max_length, timeout = query.get('max_length', self.max_length), query.get('timeout', self.timeout)
+        if not isinstance(max_length, int) or isinstance(max_length, bool) or not isinstance(timeout, (int, float)):
+            raise ValueError('max_length must be an integer and timeout a number')
+        return min(max_length, self.max_length), min(timeout, self.timeout)
+
+    def solve(self, cube, max_length, timeout):
+        import solver
+        # the symmetry cache is looked up first, so a state symmetric to a solved one costs no search
+        moves = solver.solve(cube, max_length=max_length, timeout=timeout, cache=self.solutions)
+        return None if moves is None else list(moves)
+
+
+class Server:
+    # one batcher task takes the first waiting query, lets more arrive for batch_delay seconds (unless batch_size
+    # are already waiting) and hands up to batch_size of them to the engine thread as one batch
+    def __init__(self, engine=None, batch_size=64, batch_delay=0.002, window=10000):
+        self.engine = Engine() if engine is None else engine
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.queue = None
+        self.server = None
+        self.batcher = None
+        self.in_flight = 0
+        self.started = time.perf_counter()
+        # latency of the last window requests, for /metrics
+        self.latencies = deque(maxlen=window)
+        self.counts = {'requests': 0, 'queries': 0, 'errors': 0, 'batches': 0, 'batched_queries': 0, 'max_batch': 0}
+
+    async def start(self, host='127.0.0.1', port=8080):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.engine.warm_up)
+        self.queue = asyncio.Queue()
+        self.batcher = asyncio.create_task(self.batch_loop())
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.batcher.cancel()
+        self.executor.shutdown(wait=False)
+
+    async def serve_forever(self, host='127.0.0.1', port=8080):
+        host, port = await self.start(host, port)
+        print(f'listening on http://{host}:{port}', file=sys.stderr)
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def submit(self, query, solve):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((query, solve, future))
+        return await future
+
+    async def batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            if self.batch_delay > 0 and self.queue.qsize() < self.batch_size - 1:
+                await asyncio.sleep(self.batch_delay)
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            self.in_flight = len(batch)
+            self.counts['batches'] += 1
+            self.counts['batched_queries'] += len(batch)
+            self.counts['max_batch'] = max(self.counts['max_batch'], len(batch))
+            try:
+                results = await loop.run_in_executor(self.executor, self.engine.run, [(query, solve) for query, solve, _ in batch])
+            except Exception as error:
+                results = [error] * len(batch)
+            self.in_flight = 0
+            for (_, _, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def metrics(self):
+        batches = self.counts['batches']
+        return dict(self.counts, **{
+            'uptime': round(time.perf_counter() - self.started, 3),
+            'queue_depth': self.queue.qsize() if self.queue is not None else 0,
+            'in_flight': self.in_flight,
+            'mean_batch': round(self.counts['batched_queries'] / batches, 2) if batches else 0.0,
+            'latency_ms': dict(percentiles(self.latencies), samples=len(self.latencies),
+                               max=round(max(self.latencies) * 1000, 3) if self.latencies else None),
+            'result_cache': self.engine.results.cache_info(),
+            'solution_cache': self.engine.solutions.cache_info(),
+        })
+
+    async def respond(self, method, path, body):
+        # (status, JSON value) for one request
+        path = path.split('?', 1)[0]
+        if path in ['/metrics', '/health']:
+            if method != 'GET':
+                return 405, {'error': 'use GET'}
+            return 200, self.metrics() if path == '/metrics' else {'status': 'ok'}
+        if path not in ['/check', '/solve']:
+            return 404, {'error': f'no such endpoint {path}'}
+        if method != 'POST':
+            return 405, {'error': 'use POST'}
+        try:
+            queries = json.loads(body or b'null')
+        except ValueError:
+            return 400, {'error': 'body is not JSON'}
+        solve = path == '/solve'
+        if isinstance(queries, list):
+            self.counts['queries'] += len(queries)
+            return 200, list(await asyncio.gather(*[self.submit(query, solve) for query in queries]))
+        self.counts['queries'] += 1
+        return 200, await self.submit(queries, solve)
+
+    async def handle(self, reader, writer):
+        # HTTP/1.1 with keep-alive, Content-Length bodies only
+        try:
+            while True:
+                request = await reader.readline()
+                if not request:
+                    break
+                received = time.perf_counter()
+                parts = request.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in [b'\r\n', b'\n', b'']:
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get('connection', '').lower() != 'close' and not (len(parts) == 3 and parts[2] == 'HTTP/1.0')
+                length = int(headers.get('content-length', 0) or 0)
+                if len(parts) != 3:
+                    status, value, keep_alive = 400, {'error': 'bad request line'}, False
+                elif length > Max_Body:
+                    status, value, keep_alive = 413, {'error': f'body over {Max_Body} bytes'}, False
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    try:
+                        status, value = await self.respond(parts[0], parts[1], body)
+                    except Exception as error:
+                        status, value = 500, {'error': str(error)}
+                self.counts['requests'] += 1
+                if status != 200:
+                    self.counts['errors'] += 1
+                payload = json.dumps(value).encode()
+                writer.write(f'HTTP/1.1 {status} {Status_Text[status]}\r\nContent-Type: application/json\r\n'
+                             f'Content-Length: {len(payload)}\r\nConnection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + payload)
+                await writer.drain()
+                self.latencies.append(time.perf_counter() - received)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def request(reader, writer, method, path, value=None):
+    # one keep-alive request on an open connection -> (status, JSON value)
+    body = b'' if value is None else json.dumps(value).encode()
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n'.encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in [b'\r\n', b'\n', b'']:
+            break
+        name, _, header = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(header)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def load_test(host='127.0.0.1', port=8080, queries=None, count=1000, concurrency=32, path='/check'):
+    # count requests over concurrency keep-alive connections, cycling through queries; client side throughput and
+    # latency, plus the server's /metrics afterwards
+    queries = queries or [{'moves': 'R U Ri Ui'}]
+    latencies, statuses = [], {}
+    counter = iter(range(count))
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for i in counter:
+                started = time.perf_counter()
+                status, _ = await request(reader, writer, 'POST', path, queries[i % len(queries)])
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        _, metrics = await request(reader, writer, 'GET', '/metrics')
+    finally:
+        writer.close()
+    return {'requests': count, 'concurrency': concurrency, 'elapsed': round(elapsed, 3), 'requests_per_sec': round(count / elapsed, 1),
+            'statuses': statuses, 'latency_ms': percentiles(latencies), 'server': metrics}
+
+
+def serve(host='127.0.0.1', port=8080, batch_size=64, batch_delay=0.002, cache_size=65536, max_length=21, timeout=10.0):
+    server = Server(Engine(cache_size=cache_size, max_length=max_length, timeout=timeout), batch_size=batch_size, batch_delay=batch_delay)
+    try:
+        asyncio.run(server.serve_forever(host, port))
+    except KeyboardInterrupt:
+        pass
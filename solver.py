@@ -0,0 +1,488 @@
+#! /usr/bin/env python3
+
+import os
+import time
+import warnings
+from array import array
+
+import tables
+from cube import Cube, CubeData, canonical_form, import_numpy
+
+
+class SolverData:
+    # cubie slots, in the CubeData piece square order
+    Corner_Names = ['URF', 'UFL', 'ULB', 'UBR', 'DFR', 'DLF', 'DBL', 'DRB']
+    Corner_Facelets = CubeData.Corner_Squares
+    Edge_Names = ['UR', 'UF', 'UL', 'UB', 'DR', 'DF', 'DL', 'DB', 'FR', 'FL', 'BL', 'BR']
+    Edge_Facelets = CubeData.Edge_Squares
+    Center_Squares = CubeData.Center_Squares
+    Center_Turns = ['M', 'E', 'S']
+
+    # face turns, move id = 3 * face + (0: quarter, 1: half, 2: inverse)
+    Moves = [f'{prefix}{face}{suffix}' for face in CubeData.Faces for prefix, suffix in [('', ''), ('2', ''), ('', 'i')]]
+
+    N_Twist = 2187
+    N_Flip = 2048
+    N_Slice = 495
+    N_Corner_Perm = 40320
+    N_Edge_Perm = 40320
+    N_Slice_Perm = 24
+
+
+# phase 2 subgroup <U, D, R2, L2, F2, B2>
+SolverData.Phase2_Moves = [SolverData.Moves.index(move) for move in ['U', '2U', 'Ui', 'D', '2D', 'Di', '2R', '2L', '2F', '2B']]
+SolverData.Corner_Index = CubeData.Corner_Stickers
+SolverData.Edge_Index = CubeData.Edge_Stickers
+SolverData.Center_Index = CubeData.Center_Stickers
+SolverData.Corner_Sticker = CubeData.Corner_Sticker
+SolverData.Edge_Sticker = CubeData.Edge_Sticker
+
+
+def _binomial(n, k):
+    if k < 0 or k > n:
+        return 0
+    result = 1
+    for i in range(k):
+        result = result * (n - i) // (i + 1)
+    return result
+
+
+def _perm_rank(perm):
+    values = sorted(perm)
+    rank = 0
+    for i, value in enumerate(perm):
+        rank = rank * (len(perm) - i) + values.index(value)
+        values.remove(value)
+    return rank
+
+
+def _perm_unrank(rank, size):
+    digits = []
+    for base in range(1, size + 1):
+        digits.append(rank % base)
+        rank //= base
+    values = list(range(size))
+    return [values.pop(digit) for digit in reversed(digits)]
+
+
+class CubieCube:
+    # cp[i] / ep[i]: piece sitting in slot i, co[i] / eo[i]: its orientation
+    def __init__(self, cp=None, co=None, ep=None, eo=None):
+        self.cp = list(range(8)) if cp is None else list(cp)
+        self.co = [0] * 8 if co is None else list(co)
+        self.ep = list(range(12)) if ep is None else list(ep)
+        self.eo = [0] * 12 if eo is None else list(eo)
+
+    def __eq__(self, other):
+        return (self.cp, self.co, self.ep, self.eo) == (other.cp, other.co, other.ep, other.eo)
+
+    @classmethod
+    def from_state(cls, state):
+        # centers must already be home; raises ValueError for states no face turns can solve
+        cube = cls()
+        try:
+            for slot, facelets in enumerate(SolverData.Corner_Index):
+                piece, position = SolverData.Corner_Sticker[state[facelets[0]]]
+                cube.cp[slot], cube.co[slot] = piece, (3 - position) % 3
+            for slot, facelets in enumerate(SolverData.Edge_Index):
+                cube.ep[slot], cube.eo[slot] = SolverData.Edge_Sticker[state[facelets[0]]]
+        except KeyError:
+            raise ValueError('stickers do not form valid corner and edge pieces')
+        if sorted(cube.cp) != list(range(8)) or sorted(cube.ep) != list(range(12)):
+            raise ValueError('pieces are duplicated or missing')
+        if sum(cube.co) % 3 != 0:
+            raise ValueError('corner twist is not solvable')
+        if sum(cube.eo) % 2 != 0:
+            raise ValueError('edge flip is not solvable')
+        if cube.corner_parity() != cube.edge_parity():
+            raise ValueError('permutation parity is not solvable')
+        return cube
+
+    def corner_parity(self):
+        return CubeData.parity(self.cp)
+
+    def edge_parity(self):
+        return CubeData.parity(self.ep)
+
+    def multiply(self, other):
+        # apply other (e.g. a move) to this cube
+        co, eo = self.co, self.eo
+        self.co = [(co[other.cp[i]] + other.co[i]) % 3 for i in range(8)]
+        self.cp = [self.cp[other.cp[i]] for i in range(8)]
+        self.eo = [(eo[other.ep[i]] + other.eo[i]) % 2 for i in range(12)]
+        self.ep = [self.ep[other.ep[i]] for i in range(12)]
+
+    def copy(self):
+        return CubieCube(self.cp, self.co, self.ep, self.eo)
+
+    # phase 1 coordinates
+    def get_twist(self):
+        return sum(self.co[i] * 3 ** i for i in range(7))
+
+    def set_twist(self, twist):
+        for i in range(7):
+            self.co[i] = twist % 3
+            twist //= 3
+        self.co[7] = -sum(self.co[:7]) % 3
+
+    def get_flip(self):
+        return sum(self.eo[i] << i for i in range(11))
+
+    def set_flip(self, flip):
+        for i in range(11):
+            self.eo[i] = (flip >> i) & 1
+        self.eo[11] = sum(self.eo[:11]) % 2
+
+    def get_slice(self):
+        # which 4 slots hold the FR, FL, BL, BR edges, as a combination index
+        slots = [slot for slot in range(12) if self.ep[slot] >= 8]
+        return sum(_binomial(slot, k + 1) for k, slot in enumerate(slots))
+
+    def set_slice(self, value):
+        slots = []
+        for k in range(4, 0, -1):
+            slot = k - 1
+            while _binomial(slot + 1, k) <= value:
+                slot += 1
+            value -= _binomial(slot, k)
+            slots.append(slot)
+        others = iter(range(8))
+        slice_edges = iter(range(8, 12))
+        self.ep = [next(slice_edges) if slot in slots else next(others) for slot in range(12)]
+
+    # phase 2 coordinates
+    def get_corner_perm(self):
+        return _perm_rank(self.cp)
+
+    def set_corner_perm(self, value):
+        self.cp = _perm_unrank(value, 8)
+
+    def get_edge_perm(self):
+        return _perm_rank(self.ep[:8])
+
+    def set_edge_perm(self, value):
+        self.ep[:8] = _perm_unrank(value, 8)
+
+    def get_slice_perm(self):
+        return _perm_rank([edge - 8 for edge in self.ep[8:]])
+
+    def set_slice_perm(self, value):
+        self.ep[8:] = [edge + 8 for edge in _perm_unrank(value, 4)]
+
+
+# moves allowed after a turn of last_face (index -1: no previous turn): never the same face twice,
+# and opposite faces only in one order since they commute
+SolverData.Next_Moves = dict((last_face, [move for move in range(18) if move // 3 != last_face and not (move // 6 == last_face // 2 and move // 3 < last_face)])
+                             for last_face in range(-1, 6))
+SolverData.Next_Phase2_Moves = dict((last_face, [(i, move) for i, move in enumerate(SolverData.Phase2_Moves) if move in SolverData.Next_Moves[last_face]])
+                                    for last_face in range(-1, 6))
+SolverData.Move_Cubes = [CubieCube.from_state(CubeData.Turn_Permutations[move]) for move in SolverData.Moves]
+SolverData.Goal = CubieCube()
+
+
+class SolverTables:
+    # move tables: flat array('H'), entry [coordinate * moves + move]
+    # pruning tables: bytearray of exact distances for a pair of coordinates
+    # tables come from the mapped table file when one exists, otherwise each one is built on first use
+    Version = 1
+    Move_Tables = {
+        'twist_move': (SolverData.N_Twist, False, CubieCube.set_twist, CubieCube.get_twist, True),
+        'flip_move': (SolverData.N_Flip, False, CubieCube.set_flip, CubieCube.get_flip, False),
+        'slice_move': (SolverData.N_Slice, False, CubieCube.set_slice, CubieCube.get_slice, False),
+        'corner_perm_move': (SolverData.N_Corner_Perm, True, CubieCube.set_corner_perm, CubieCube.get_corner_perm, True),
+        'edge_perm_move': (SolverData.N_Edge_Perm, True, CubieCube.set_edge_perm, CubieCube.get_edge_perm, False),
+        'slice_perm_move': (SolverData.N_Slice_Perm, True, CubieCube.set_slice_perm, CubieCube.get_slice_perm, False)}
+    Pruning_Tables = {
+        'twist_slice_prune': ('twist_move', 'slice_move'),
+        'flip_slice_prune': ('flip_move', 'slice_move'),
+        'twist_flip_prune': ('twist_move', 'flip_move'),
+        'corner_slice_prune': ('corner_perm_move', 'slice_perm_move'),
+        'edge_slice_prune': ('edge_perm_move', 'slice_perm_move')}
+    Table_Names = list(Move_Tables.keys()) + list(Pruning_Tables.keys())
+    _Instance = None
+
+    def __init__(self, loaded=None):
+        for name, table in (loaded or {}).items():
+            setattr(self, name, table)
+
+    def __getattr__(self, name):
+        if name not in SolverTables.Table_Names:
+            raise AttributeError(name)
+        table = self.build_table(name)
+        setattr(self, name, table)
+        return table
+
+    @classmethod
+    def get(cls):
+        if cls._Instance is None:
+            cls._Instance = cls.load()
+        return cls._Instance
+
+    @classmethod
+    def load(cls, path=None, verify=True):
+        path = tables.default_path() if path is None else path
+        if not os.path.exists(path):
+            return cls()
+        try:
+            return cls(tables.open_tables(path, SolverTables.Version, verify))
+        except ValueError as error:
+            warnings.warn(f'ignoring table file: {error}')
+            return cls()
+
+    @classmethod
+    def save(cls, path=None):
+        path = tables.default_path() if path is None else path
+        built = cls()
+        return tables.write_tables(path, dict((name, getattr(built, name)) for name in SolverTables.Table_Names), SolverTables.Version)
+
+    def build_table(self, name):
+        if name in SolverTables.Move_Tables:
+            size, phase2, setter, getter, corners = SolverTables.Move_Tables[name]
+            return SolverTables.move_table(size, SolverData.Phase2_Moves if phase2 else range(18), setter, getter, corners)
+        name_a, name_b = SolverTables.Pruning_Tables[name]
+        size_a, phase2, _, getter_a, _ = SolverTables.Move_Tables[name_a]
+        size_b, _, _, getter_b, _ = SolverTables.Move_Tables[name_b]
+        return SolverTables.pruning_table(getattr(self, name_a), size_a, getattr(self, name_b), size_b, 10 if phase2 else 18,
+                                          (getter_a(SolverData.Goal), getter_b(SolverData.Goal)))
+
+    @staticmethod
+    def move_table(size, moves, setter, getter, corners):
+        # only the corner or the edge half of the cubie is touched by a coordinate
+        table = array('H', bytes(2 * size * len(moves)))
+        for value in range(size):
+            cube = CubieCube()
+            setter(cube, value)
+            for i, move in enumerate(moves):
+                move_cube = SolverData.Move_Cubes[move]
+                if corners:
+                    moved = CubieCube(cp=[cube.cp[j] for j in move_cube.cp], co=[(cube.co[j] + o) % 3 for j, o in zip(move_cube.cp, move_cube.co)])
+                else:
+                    moved = CubieCube(ep=[cube.ep[j] for j in move_cube.ep], eo=[(cube.eo[j] + o) % 2 for j, o in zip(move_cube.ep, move_cube.eo)])
+                table[value * len(moves) + i] = getter(moved)
+        return table
+
+    @staticmethod
+    def pruning_table(move_a, size_a, move_b, size_b, moves, start):
+        # breadth first search over the pair (a, b), index a * size_b + b
+        table = bytearray(b'\xff' * (size_a * size_b))
+        table[start[0] * size_b + start[1]] = 0
+        frontier = [start[0] * size_b + start[1]]
+        depth = 0
+        np = import_numpy()
+        if np is not None:
+            a_moves = np.frombuffer(move_a, dtype=np.uint16).reshape(size_a, moves).astype(np.int64)
+            b_moves = np.frombuffer(move_b, dtype=np.uint16).reshape(size_b, moves).astype(np.int64)
+            distances = np.frombuffer(table, dtype=np.uint8)
+            frontier = np.array(frontier, dtype=np.int64)
+            while len(frontier):
+                depth += 1
+                a, b = np.divmod(frontier, size_b)
+                reached = (a_moves[a] * size_b + b_moves[b]).ravel()
+                distances[reached[distances[reached] == 0xff]] = depth
+                frontier = np.flatnonzero(distances == depth)
+            return table
+        while frontier:
+            depth += 1
+            next_frontier = []
+            for index in frontier:
+                a, b = divmod(index, size_b)
+                a, b = a * moves, b * moves
+                for move in range(moves):
+                    reached = move_a[a + move] * size_b + move_b[b + move]
+                    if table[reached] == 0xff:
+                        table[reached] = depth
+                        next_frontier.append(reached)
+            frontier = next_frontier
+        return table
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class TwoPhaseSearch:
+    # max_length is a hard bound on both phases together; the first solution within it ends the search, unless
+    # shortest is set, when the bound tightens below each solution found until the deadline or the search space
+    # runs out, and solution is the shortest found
+    def __init__(self, cubie, tables, max_length, deadline, shortest=False):
+        self.cubie = cubie
+        self.tables = tables
+        self.max_length = max_length
+        self.deadline = deadline
+        self.shortest = shortest
+        self.solution = None
+        self.finished = False
+        self.path = []
+        goal = SolverData.Goal
+        self.goal_slice = goal.get_slice()
+
+    def run(self):
+        twist, flip, slice_ = self.cubie.get_twist(), self.cubie.get_flip(), self.cubie.get_slice()
+        try:
+            depth = self.phase1_prune(twist, flip, slice_)
+            while not self.finished and depth <= self.bound():
+                self.phase1(twist, flip, slice_, depth)
+                depth += 1
+        except SearchTimeout:
+            pass
+        return self.solution
+
+    def bound(self):
+        # longest solution still wanted
+        return self.max_length if self.solution is None else len(self.solution) - 1
+
+    def phase1(self, twist, flip, slice_, togo):
+        if togo == 0:
+            if twist != 0 or flip != 0 or slice_ != self.goal_slice:
+                return
+            # a phase 1 path ending in a phase 2 move was already covered by a shorter one
+            if not self.path or self.path[-1] not in SolverData.Phase2_Moves:
+                self.phase2_start()
+            return
+        tables = self.tables
+        twist_move, flip_move, slice_move = tables.twist_move, tables.flip_move, tables.slice_move
+        twist_slice, flip_slice, twist_flip = tables.twist_slice_prune, tables.flip_slice_prune, tables.twist_flip_prune
+        path = self.path
+        for move in SolverData.Next_Moves[path[-1] // 3 if path else -1]:
+            new_twist = twist_move[twist * 18 + move]
+            new_slice = slice_move[slice_ * 18 + move]
+            if twist_slice[new_twist * 495 + new_slice] >= togo:
+                continue
+            new_flip = flip_move[flip * 18 + move]
+            if flip_slice[new_flip * 495 + new_slice] >= togo or twist_flip[new_twist * 2048 + new_flip] >= togo:
+                continue
+            path.append(move)
+            self.phase1(new_twist, new_flip, new_slice, togo - 1)
+            path.pop()
+            if self.finished:
+                return
+
+    def phase1_prune(self, twist, flip, slice_):
+        return max(self.tables.twist_slice_prune[twist * 495 + slice_], self.tables.flip_slice_prune[flip * 495 + slice_],
+                   self.tables.twist_flip_prune[twist * 2048 + flip])
+
+    def phase2_start(self):
+        if time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        cubie = self.cubie.copy()
+        for move in self.path:
+            cubie.multiply(SolverData.Move_Cubes[move])
+        corner, edge, slice_ = cubie.get_corner_perm(), cubie.get_edge_perm(), cubie.get_slice_perm()
+        limit = self.bound() - len(self.path)
+        depth1 = len(self.path)
+        for depth in range(self.phase2_prune(corner, edge, slice_), limit + 1):
+            if self.phase2(corner, edge, slice_, depth):
+                self.solution = [SolverData.Moves[move] for move in self.path]
+                self.finished = not self.shortest or len(self.solution) == 0
+                break
+        del self.path[depth1:]
+
+    def phase2_prune(self, corner, edge, slice_):
+        return max(self.tables.corner_slice_prune[corner * 24 + slice_], self.tables.edge_slice_prune[edge * 24 + slice_])
+
+    def phase2(self, corner, edge, slice_, togo):
+        if togo == 0:
+            return corner == 0 and edge == 0 and slice_ == 0
+        tables = self.tables
+        corner_move, edge_move, slice_move = tables.corner_perm_move, tables.edge_perm_move, tables.slice_perm_move
+        corner_slice, edge_slice = tables.corner_slice_prune, tables.edge_slice_prune
+        path = self.path
+        for i, move in SolverData.Next_Phase2_Moves[path[-1] // 3 if path else -1]:
+            new_slice = slice_move[slice_ * 10 + i]
+            new_corner = corner_move[corner * 10 + i]
+            if corner_slice[new_corner * 24 + new_slice] >= togo:
+                continue
+            new_edge = edge_move[edge * 10 + i]
+            if edge_slice[new_edge * 24 + new_slice] >= togo:
+                continue
+            path.append(move)
+            if self.phase2(new_corner, new_edge, new_slice, togo - 1):
+                return True
+            path.pop()
+        return False
+
+
+def center_moves(state):
+    # shortest slice-turn sequence returning the centers home, applied to state in place
+    goal = bytes(SolverData.Center_Index)
+    turns = [f'{prefix}{turn}{suffix}' for turn in SolverData.Center_Turns for prefix, suffix in [('', ''), ('2', ''), ('', 'i')]]
+    seen = {bytes(state[i] for i in SolverData.Center_Index): []}
+    frontier = [(bytes(state), [])]
+    while frontier:
+        next_frontier = []
+        for current, moves in frontier:
+            if bytes(current[i] for i in SolverData.Center_Index) == goal:
+                state[:] = current
+                return moves
+            for turn in turns:
+                moved = bytearray(current)
+                CubeData.apply_permutation(moved, CubeData.Turn_Permutations[turn])
+                centers = bytes(moved[i] for i in SolverData.Center_Index)
+                if centers not in seen:
+                    seen[centers] = moves + [turn]
+                    next_frontier.append((bytes(moved), moves + [turn]))
+        frontier = next_frontier
+    raise ValueError('centers are not a valid cube orientation')
+
+
+def solve(cube, max_length=21, timeout=10.0, cache=None):
+    # returns a list of turns in Turn_Pattern notation: the first solution found of at most max_length turns
+    # (a hard bound), None if there is none before the timeout; solve_shortest keeps looking for shorter ones
+    # missing tables are built before the clock starts
+    # with a TranspositionCache the canonical form is solved (or found in the cache) and its solution mapped back,
+    # so the result starts with whole cube rotations instead of slice turns when the centers are not home
+    # a configuration that is not a solvable cube raises ValueError instead of being read as the solved cube
+    if not isinstance(cube, Cube):
+        cube = Cube.from_state(CubeData.decode_configuration(cube))
+    if cache is not None:
+        key, rotation, symmetry = canonical_form(cube.state)
+        moves = cache.get(key)
+        # a cached solution from a query allowing more turns is searched again, once, within this bound
+        if moves is None or len(moves) > max_length:
+            moves = search(Cube.from_state(key), max_length, timeout)
+            if moves is None:
+                return None
+            moves = tuple(moves)
+            cache.put(key, moves)
+        mapping = CubeData.symmetry_moves()[symmetry]
+        return list(rotation) + [mapping[move] for move in moves]
+    return search(cube, max_length, timeout)
+
+
+def solve_shortest(cube, max_length=21, timeout=10.0):
+    # the shortest solution of at most max_length turns found before the timeout (None if there is none): the
+    # search goes on past the first solution, so it usually takes the whole timeout
+    if not isinstance(cube, Cube):
+        cube = Cube.from_state(CubeData.decode_configuration(cube))
+    return search(cube, max_length, timeout, shortest=True)
+
+
+def search(cube, max_length, timeout, shortest=False):
+    solver_tables = SolverTables.get()
+    for name in SolverTables.Table_Names:
+        getattr(solver_tables, name)
+    deadline = time.perf_counter() + timeout
+    state = bytearray(cube.state)
+    prefix = center_moves(state)
+    if len(prefix) > max_length:
+        return None
+    cubie = CubieCube.from_state(state)
+    moves = TwoPhaseSearch(cubie, solver_tables, max_length - len(prefix), deadline, shortest).run()
+    return None if moves is None else prefix + moves
+
+
+def check_solutions(states, max_length=21, timeout=10.0):
+    # solves each sticker state and replays the solution on it, raising ValueError for one that is too long or
+    # does not solve the cube; returns (turns, seconds) per state, turns None when nothing was found in time
+    results = []
+    for state in states:
+        start = time.perf_counter()
+        moves = solve(Cube.from_state(state), max_length=max_length, timeout=timeout)
+        seconds = time.perf_counter() - start
+        if moves is not None:
+            cube = Cube.from_state(state)
+            cube.rotate_sequence(moves)
+            if len(moves) > max_length or not cube.is_solved():
+                raise ValueError(f'bad solution {" ".join(moves)} for {Cube.from_state(state).to_configuration()}')
+        results.append((moves, seconds))
+    return results
@@ -0,0 +1,81 @@
+#! /usr/bin/env python3
+
+import mmap
+import os
+import struct
+import zlib
+
+# file layout:
+#   header   magic, format version, table set version, table count
+#   entries  one per table: name, array typecode, data offset, data size, crc32 of the data
+#   crc32 of header + entries
+#   data     each table aligned to Alignment bytes, so it can be used straight from the mapped pages
+Magic = b'CUBETBLS'
+Format_Version = 1
+Alignment = 64
+Header_Struct = struct.Struct('<8sHHI')
+Entry_Struct = struct.Struct('<32s2sQQI')
+Checksum_Struct = struct.Struct('<I')
+
+
+def default_path():
+    return os.environ.get('CUBE_SOLVING_TABLES', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'solver_tables.bin'))
+
+
+def _aligned(offset):
+    return (offset + Alignment - 1) // Alignment * Alignment
+
+
+def write_tables(path, tables, version):
+    # tables: name -> array / bytearray; written to a temporary file and moved into place
+    names = list(tables.keys())
+    offset = _aligned(Header_Struct.size + Entry_Struct.size * len(names) + Checksum_Struct.size)
+    entries = []
+    for name in names:
+        data = memoryview(tables[name]).cast('B')
+        typecode = getattr(tables[name], 'typecode', 'B')
+        entries.append(Entry_Struct.pack(name.encode(), typecode.encode(), offset, len(data), zlib.crc32(data)))
+        offset = _aligned(offset + len(data))
+    header = Header_Struct.pack(Magic, Format_Version, version, len(names)) + b''.join(entries)
+    header += Checksum_Struct.pack(zlib.crc32(header))
+
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as handle:
+        handle.write(header)
+        for name, entry in zip(names, entries):
+            _, _, data_offset, _, _ = Entry_Struct.unpack(entry)
+            handle.write(bytes(data_offset - handle.tell()))
+            handle.write(memoryview(tables[name]).cast('B'))
+    os.replace(temp_path, path)
+    return path
+
+
+def open_tables(path, version, verify=True):
+    # maps the file read-only; every process opening it shares the same page cache copy
+    with open(path, 'rb') as handle:
+        mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    if len(view) < Header_Struct.size:
+        raise ValueError(f'{path}: truncated table file')
+    magic, format_version, table_version, count = Header_Struct.unpack_from(view, 0)
+    if magic != Magic:
+        raise ValueError(f'{path}: not a table file')
+    if format_version != Format_Version or table_version != version:
+        raise ValueError(f'{path}: table file version {format_version}.{table_version}, expected {Format_Version}.{version}')
+    header_size = Header_Struct.size + Entry_Struct.size * count
+    if len(view) < header_size + Checksum_Struct.size:
+        raise ValueError(f'{path}: truncated table file')
+    if Checksum_Struct.unpack_from(view, header_size)[0] != zlib.crc32(view[:header_size]):
+        raise ValueError(f'{path}: header checksum mismatch')
+
+    tables = {}
+    for i in range(count):
+        name, typecode, offset, size, checksum = Entry_Struct.unpack_from(view, Header_Struct.size + Entry_Struct.size * i)
+        if offset + size > len(view):
+            raise ValueError(f'{path}: truncated table file')
+        data = view[offset:offset + size]
+        if verify and zlib.crc32(data) != checksum:
+            raise ValueError(f'{path}: checksum mismatch for {name.rstrip(bytes(1)).decode()}')
+        typecode = typecode.rstrip(bytes(1)).decode()
+        tables[name.rstrip(bytes(1)).decode()] = data if typecode == 'B' else data.cast(typecode)
+    return tables